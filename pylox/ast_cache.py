@@ -0,0 +1,113 @@
+"""
+Keeps resolved programs in a __loxcache__ directory next to the script, so
+that running an unchanged script skips the scanner, parser and resolver.
+
+Programs are pickled, which recurses into the children of a node. To keep
+that recursion shallow for programs of any depth, every node of the program
+is pickled first, in an order where each node comes before the node holding
+it: by the time a node is written its children already are, and are only
+referred to.
+"""
+
+import gc
+import hashlib
+import importlib.util
+import os
+import pickle
+
+import expressions
+import statements
+
+# bump whenever the syntax tree, what the resolver records on it or what the
+# optimizer makes of it changes
+VERSION = 4
+CACHE_DIR = "__loxcache__"
+
+NODE_TYPES = {
+    cls
+    for module in (expressions, statements)
+    for cls in vars(module).values()
+    if isinstance(cls, type) and issubclass(cls, (expressions.Expr, statements.Stmt))
+}
+
+
+def flatten(stmts):
+    # every node of the program, each one before the node that holds it
+    nodes = []
+    stack = list(stmts)
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        for slot in type(node).__slots__:
+            field = getattr(node, slot)
+            if type(field) in NODE_TYPES:
+                stack.append(field)
+            elif type(field) is tuple or type(field) is list:
+                stack.extend(item for item in field if type(item) in NODE_TYPES)
+
+    nodes.reverse()
+    return nodes
+
+
+def without_gc(function, *args):
+    # a program is a great many small objects that all stay alive, which the
+    # cycle collector would otherwise keep scanning while they are created
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return function(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class AstCache:
+    """
+    Stores the resolved program of a script. An entry is only used if it was
+    made from the same source, with the same options, for the same backend,
+    by the same cache format and python version.
+    """
+
+    def __init__(self, script, backend, optimize=True):
+        directory, name = os.path.split(os.path.abspath(script))
+        name = os.path.splitext(name)[0] + ".loxc"
+        self.path = os.path.join(directory, CACHE_DIR, name)
+        self.backend = backend
+        self.optimize = optimize
+
+    def key(self, source):
+        # backends differ in what the resolver records, so each has its own
+        digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+        digest.update(bytes([VERSION, self.optimize]))
+        digest.update(self.backend.encode() + b"\0")
+        digest.update(source.encode())
+        return digest.digest()
+
+    def load(self, source):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        key = self.key(source)
+        if not data.startswith(key):
+            return None
+        try:
+            _nodes, stmts = without_gc(pickle.loads, data[len(key) :])
+        except Exception:  # anything can come out of a damaged pickle
+            return None
+        return stmts
+
+    def store(self, source, stmts):
+        # a cache we can't write is not an error, the script just won't be cached
+        tmp = f"{self.path}.{os.getpid()}"
+        try:
+            program = (flatten(stmts), stmts)
+            data = without_gc(pickle.dumps, program, pickle.HIGHEST_PROTOCOL)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(self.key(source) + data)
+            os.replace(tmp, self.path)
+        except (OSError, pickle.PicklingError, RecursionError):
+            pass
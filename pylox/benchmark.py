@@ -0,0 +1,259 @@
+"""
+Runs the Lox programs in benchmarks/ and times them, to tell whether a change
+to the interpreter makes them faster or slower.
+
+Each program goes through the scanner, parser, resolver and optimizer, then
+runs on the chosen backend, a few times over. The results (the times of the
+front end and of each run, the peak memory of one more run and a hash of what
+the program printed) are written as JSON. Given the JSON of an earlier run as
+a baseline, the harness prints how every program changed and exits with an
+error if any of them got slower than the threshold allows.
+
+    python benchmark.py --output before.json
+    ... change the interpreter ...
+    python benchmark.py --baseline before.json
+"""
+
+import argparse
+import contextlib
+import gc
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from lox import Lox
+from main import front_end, make_interpreter
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def find_benchmarks(names=None):
+    found = {
+        os.path.splitext(name)[0]: os.path.join(BENCHMARKS_DIR, name)
+        for name in sorted(os.listdir(BENCHMARKS_DIR))
+        if name.endswith(".lx")
+    }
+    if not names:
+        return found
+
+    unknown = [name for name in names if name not in found]
+    if unknown:
+        raise BenchmarkError(f"no such benchmark: {', '.join(unknown)}")
+    return {name: found[name] for name in names}
+
+
+def run_once(source, backend, optimize=True):
+    # returns the seconds spent in the front end and running, and the output
+    Lox.had_error = Lox.had_runtime_error = False
+    interpreter = make_interpreter(backend)
+    output = io.StringIO()
+    gc.collect()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        statements = front_end(source, interpreter, optimize)
+        if statements is None:
+            raise BenchmarkError("the program has errors")
+        if backend == "python":
+            statements = interpreter.compile(statements)
+            if statements is None:
+                raise BenchmarkError("the program nests too deeply")
+        parsed = time.perf_counter()
+
+        if backend == "python":
+            interpreter.run(statements)
+        else:
+            interpreter.interpret(statements)
+        done = time.perf_counter()
+
+    if Lox.had_runtime_error:
+        raise BenchmarkError(output.getvalue().splitlines()[-1])
+    return parsed - start, done - parsed, output.getvalue()
+
+
+def peak_memory(source, backend, optimize=True):
+    # a run of its own, as tracing every allocation slows the program down
+    tracemalloc.start()
+    try:
+        run_once(source, backend, optimize)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(path, backend, repeat=3, optimize=True, memory=True):
+    with open(path, "r") as f:
+        source = f.read()
+
+    front, runs, outputs = [], [], set()
+    for _ in range(repeat):
+        parse_time, run_time, output = run_once(source, backend, optimize)
+        front.append(parse_time)
+        runs.append(run_time)
+        outputs.add(output)
+    if len(outputs) > 1:
+        raise BenchmarkError("the program printed something else on another run")
+
+    return {
+        "front_end": min(front),
+        "runs": runs,
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "peak_memory": peak_memory(source, backend, optimize) if memory else None,
+        "output": hashlib.sha1(outputs.pop().encode()).hexdigest(),
+    }
+
+
+def run_suite(names, backend, repeat=3, optimize=True, memory=True, log=sys.stderr):
+    results = {}
+    for name, path in find_benchmarks(names).items():
+        print(f"{name}...", end=" ", flush=True, file=log)
+        results[name] = run_benchmark(path, backend, repeat, optimize, memory)
+        print(f"{results[name]['min']:.3f}s", file=log)
+
+    return {
+        "backend": backend,
+        "optimize": optimize,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "benchmarks": results,
+    }
+
+
+def compare(baseline, current, threshold=0.05, file=sys.stdout):
+    """
+    Prints each benchmark's best run next to the baseline's and returns the
+    names of those slower by more than threshold (a fraction of the baseline).
+    """
+    slower = []
+    if (baseline["backend"], baseline["optimize"]) != (
+        current["backend"],
+        current["optimize"],
+    ):
+        print("warning: the baseline was run with other options", file=file)
+
+    print(
+        f"{'benchmark':<18} {'baseline':>10} {'current':>10} {'change':>9}", file=file
+    )
+    for name, result in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            print(f"{name:<18} {'-':>10} {result['min']:>10.3f}", file=file)
+            continue
+
+        change = result["min"] / base["min"] - 1
+        verdict = ""
+        if change > threshold:
+            verdict = "slower"
+            slower.append(name)
+        elif change < -threshold:
+            verdict = "faster"
+        if result["output"] != base["output"]:
+            verdict += " (output differs)"
+        print(
+            f"{name:<18} {base['min']:>10.3f} {result['min']:>10.3f} "
+            f"{change:>+9.1%} {verdict}",
+            file=file,
+        )
+
+        if result["peak_memory"] is not None and base["peak_memory"] is not None:
+            growth = result["peak_memory"] / base["peak_memory"] - 1
+            if abs(growth) > threshold:
+                print(f"{'':<18} peak memory {growth:+.1%}", file=file)
+
+    return slower
+
+
+def report(results, file=sys.stdout):
+    print(
+        f"{'benchmark':<18} {'front end':>10} {'min':>10} {'median':>10} {'peak KiB':>10}",
+        file=file,
+    )
+    for name, result in results["benchmarks"].items():
+        memory = result["peak_memory"]
+        memory = "-" if memory is None else f"{memory // 1024}"
+        print(
+            f"{name:<18} {result['front_end']:>10.4f} {result['min']:>10.3f} "
+            f"{result['median']:>10.3f} {memory:>10}",
+            file=file,
+        )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(prog="benchmark")
+    argparser.add_argument(
+        "names", nargs="*", help="benchmarks to run (default: all of them)"
+    )
+    argparser.add_argument(
+        "--backend",
+        choices=["tree", "closure", "vm", "python"],
+        default="tree",
+        help="execution engine (default: tree-walking interpreter)",
+    )
+    argparser.add_argument(
+        "--no-optimize",
+        dest="optimize",
+        action="store_false",
+        help="run the programs without constant folding and dead code removal",
+    )
+    argparser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="how many times to run each benchmark (default: 3)",
+    )
+    argparser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="skip the extra run measuring peak memory",
+    )
+    argparser.add_argument(
+        "--output", metavar="FILE", help="write the results to FILE as JSON"
+    )
+    argparser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help="compare the results with those of an earlier --output",
+    )
+    argparser.add_argument(
+        "--threshold",
+        type=float,
+        default=5.0,
+        metavar="PERCENT",
+        help="how much slower than the baseline counts as slower (default: 5)",
+    )
+    args = argparser.parse_args()
+    if args.repeat < 1:
+        argparser.error("--repeat must be at least 1")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    try:
+        results = run_suite(
+            args.names, args.backend, args.repeat, args.optimize, args.memory
+        )
+    except BenchmarkError as ex:
+        sys.exit(f"benchmark: {ex}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is None:
+        report(results)
+    elif compare(baseline, results, args.threshold / 100):
+        sys.exit(1)
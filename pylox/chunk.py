@@ -0,0 +1,140 @@
+from array import array
+
+# opcodes, operands follow the opcode in the instruction stream
+OP_CONSTANT = 0  # constant index
+OP_NIL = 1
+OP_TRUE = 2
+OP_FALSE = 3
+OP_POP = 4
+OP_GET_LOCAL = 5  # slot
+OP_SET_LOCAL = 6  # slot
+OP_GET_GLOBAL = 7  # name constant index
+OP_DEFINE_GLOBAL = 8  # name constant index
+OP_SET_GLOBAL = 9  # name constant index
+OP_GET_UPVALUE = 10  # upvalue index
+OP_SET_UPVALUE = 11  # upvalue index
+OP_GET_PROPERTY = 12  # name constant index
+OP_SET_PROPERTY = 13  # name constant index
+OP_GET_SUPER = 14  # name constant index
+OP_EQUAL = 15
+OP_NOT_EQUAL = 16
+OP_GREATER = 17
+OP_GREATER_EQUAL = 18
+OP_LESS = 19
+OP_LESS_EQUAL = 20
+OP_ADD = 21
+OP_SUBTRACT = 22
+OP_MULTIPLY = 23
+OP_DIVIDE = 24
+OP_NOT = 25
+OP_NEGATE = 26
+OP_PRINT = 27
+OP_ASSERT = 28
+OP_JUMP = 29  # forward offset
+OP_JUMP_IF_FALSE = 30  # forward offset, condition stays on the stack
+OP_POP_JUMP_IF_FALSE = 31  # forward offset, condition is popped
+OP_LOOP = 32  # backward offset
+OP_CALL = 33  # argument count
+OP_INVOKE = 34  # name constant index, argument count
+OP_SUPER_INVOKE = 35  # name constant index, argument count
+OP_CLOSURE = 36  # function constant index, (is_local, index) per upvalue
+OP_CLOSE_UPVALUE = 37
+OP_RETURN = 38
+OP_CLASS = 39  # name constant index
+OP_INHERIT = 40
+OP_METHOD = 41  # name constant index
+
+OPCODE_NAMES = {
+    value: name for name, value in globals().items() if name.startswith("OP_")
+}
+
+OPERAND_COUNTS = {
+    OP_CONSTANT: 1,
+    OP_GET_LOCAL: 1,
+    OP_SET_LOCAL: 1,
+    OP_GET_GLOBAL: 1,
+    OP_DEFINE_GLOBAL: 1,
+    OP_SET_GLOBAL: 1,
+    OP_GET_UPVALUE: 1,
+    OP_SET_UPVALUE: 1,
+    OP_GET_PROPERTY: 1,
+    OP_SET_PROPERTY: 1,
+    OP_GET_SUPER: 1,
+    OP_JUMP: 1,
+    OP_JUMP_IF_FALSE: 1,
+    OP_POP_JUMP_IF_FALSE: 1,
+    OP_LOOP: 1,
+    OP_CALL: 1,
+    OP_INVOKE: 2,
+    OP_SUPER_INVOKE: 2,
+    OP_CLASS: 1,
+    OP_METHOD: 1,
+}
+
+
+class Chunk:
+    def __init__(self):
+        self.code = array("I")
+        self.lines = array("I")  # source line of every entry in `code`
+        self.constants = []
+        self.constant_index = {}
+
+    def write(self, value, line):
+        self.code.append(value)
+        self.lines.append(line)
+
+    def add_constant(self, value):
+        # numbers and strings are deduplicated, keyed so that 1.0 and true
+        # (or 0.0 and -0.0) stay apart
+        key = None
+        if type(value) is float:
+            key = (float, repr(value))
+        elif type(value) is str:
+            key = (str, value)
+        if key is not None and key in self.constant_index:
+            return self.constant_index[key]
+
+        self.constants.append(value)
+        index = len(self.constants) - 1
+        if key is not None:
+            self.constant_index[key] = index
+        return index
+
+    def disassemble(self, name):
+        lines = [f"== {name} =="]
+        offset = 0
+        while offset < len(self.code):
+            op = self.code[offset]
+            operands = list(
+                self.code[offset + 1 : offset + 1 + OPERAND_COUNTS.get(op, 0)]
+            )
+            size = 1 + len(operands)
+            if op == OP_CLOSURE:
+                function = self.constants[self.code[offset + 1]]
+                operands = list(
+                    self.code[offset + 1 : offset + 2 + 2 * function.upvalue_count]
+                )
+                size = 1 + len(operands)
+            elif op in (OP_CONSTANT, OP_GET_GLOBAL, OP_DEFINE_GLOBAL, OP_SET_GLOBAL):
+                operands.append(repr(self.constants[operands[0]]))
+
+            lines.append(
+                f"{offset:04d} {self.lines[offset]:4d} {OPCODE_NAMES[op]} "
+                + " ".join(str(operand) for operand in operands)
+            )
+            offset += size
+
+        return "\n".join(lines)
+
+
+class ObjFunction:
+    def __init__(self, name, arity):
+        self.name = name
+        self.arity = arity
+        self.upvalue_count = 0
+        self.chunk = Chunk()
+
+    def __str__(self):
+        if not self.name:
+            return "<script>"
+        return f"<fn {self.name}>"
@@ -0,0 +1,639 @@
+import operator
+
+from lox import Lox
+from tokens import *
+from expressions import GetExpr, LiteralExpr, SuperExpr
+from environment import Environment
+from statements import ProbeStmt
+from interpreter import (
+    Interpreter,
+    LoxClass,
+    LoxFunction,
+    LoxInstance,
+    RunTimeError,
+    TailCall,
+    field_offset,
+    find_method,
+    set_field,
+)
+
+# Every node of the resolved AST is turned into a python closure exactly once.
+# Expression closures take the current environment and return a value.
+# Statement closures take the current environment and return None, or a
+# one element tuple holding the value of an executed `return` statement.
+
+NUMERIC_OPS = {
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+}
+
+
+class ClosureFunction(LoxFunction):
+    def __init__(self, stmt, body, closure, init):
+        super().__init__(stmt, closure, init)
+        self.body = body
+
+    def call(self, interpreter, args):
+        function = self
+        interpreter.depth += 1
+        try:
+            while True:
+                result = function.body(Environment(function.closure, args))
+                if type(result) is not TailCall:
+                    break
+                # trampoline, so tail calls don't grow the python stack
+                function, args = result.function, result.args
+        finally:
+            interpreter.depth -= 1
+
+        # in a construtor, we always want to return the object
+        if function.init:
+            return args[0]
+        if result is not None:
+            return result[0]
+
+
+class ClosureInterpreter(Interpreter):
+    def interpret(self, statements):
+        try:
+            run = ClosureCompiler(self).compile_stmts(statements)
+        except RecursionError:
+            Lox.nesting_error(statements)
+            return
+
+        try:
+            run(None)
+        except RunTimeError as ex:
+            Lox.runtime_error(ex)
+
+
+class ClosureCompiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.scope_depth = 0  # zero while compiling top level code
+
+    def compile(self, node):
+        return node.accept(self)
+
+    def compile_stmts(self, stmts):
+        if stmts and all(type(stmt) is ProbeStmt for stmt in stmts):
+            return self.compile_probed_stmts(stmts)
+
+        # a list rather than a generator, which tuple() would drain from C
+        compiled = tuple([self.compile(stmt) for stmt in stmts])
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def run(env):
+            for stmt in compiled:
+                result = stmt(env)
+                if result is not None:
+                    return result
+
+        return run
+
+    def compile_probed_stmts(self, stmts):
+        # counts the probes of a coverage run here rather than in a closure
+        # around each statement, which would add a python frame to every one
+        probed = tuple([(probe, self.compile(probe.stmt)) for probe in stmts])
+
+        def run_probed(env):
+            for probe, stmt in probed:
+                probe.hits += 1
+                result = stmt(env)
+                if result is not None:
+                    return result
+
+        return run_probed
+
+    def compile_scope(self, stmts):
+        self.scope_depth += 1
+        run = self.compile_stmts(stmts)
+        self.scope_depth -= 1
+        return run
+
+    def compile_lookup(self, expr, name):
+        if expr.depth is None:
+            globals = self.interpreter.globals
+
+            def lookup_global(env):
+                try:
+                    return globals[name.lexeme]
+                except KeyError:
+                    raise RunTimeError(name, f"Undefined variable '{name.lexeme}'.")
+
+            return lookup_global
+
+        depth, slot = expr.depth, expr.slot
+        if depth == 0:
+            return lambda env: env.values[slot]
+        if depth == 1:
+            return lambda env: env.enclosing.values[slot]
+        return lambda env: env.ancestor(depth).values[slot]
+
+    def compile_define(self, name, value_expr):
+        if self.scope_depth == 0:
+            globals = self.interpreter.globals
+            lexeme = name.lexeme
+
+            def define_global(env):
+                globals[lexeme] = value_expr(env)
+
+            return define_global
+
+        def define(env):
+            env.values.append(value_expr(env))
+
+        return define
+
+    # statements
+    def visit_print_stmt(self, stmt):
+        expr = self.compile(stmt.expr)
+        stringify = self.interpreter.stringify
+
+        def print_stmt(env):
+            print(stringify(expr(env)))
+
+        return print_stmt
+
+    def visit_assert_stmt(self, stmt):
+        expr = self.compile(stmt.expr)
+        token = stmt.token
+
+        def assert_stmt(env):
+            value = expr(env)
+            if value is None or value is False:
+                raise RunTimeError(token, "Assert Failed.")
+
+        return assert_stmt
+
+    def visit_expr_stmt(self, stmt):
+        expr = self.compile(stmt.expr)
+
+        def expr_stmt(env):
+            expr(env)
+
+        return expr_stmt
+
+    def visit_var_stmt(self, stmt):
+        if not stmt.expr:
+            return self.compile_define(stmt.name, lambda env: None)
+
+        return self.compile_define(stmt.name, self.compile(stmt.expr))
+
+    def visit_block_stmt(self, stmt):
+        run = self.compile_scope(stmt.stmts)
+
+        def block_stmt(env):
+            return run(Environment(env))
+
+        return block_stmt
+
+    def visit_if_statement(self, stmt):
+        condition = self.compile(stmt.condition)
+        then = self.compile(stmt.then)
+        if not stmt.otherwise:
+
+            def if_stmt(env):
+                value = condition(env)
+                if value is not None and value is not False:
+                    return then(env)
+
+            return if_stmt
+
+        otherwise = self.compile(stmt.otherwise)
+
+        def if_else_stmt(env):
+            value = condition(env)
+            if value is not None and value is not False:
+                return then(env)
+            return otherwise(env)
+
+        return if_else_stmt
+
+    def visit_while_statement(self, stmt):
+        condition = self.compile(stmt.condition)
+        body = self.compile(stmt.stmt)
+
+        def while_stmt(env):
+            value = condition(env)
+            while value is not None and value is not False:
+                result = body(env)
+                if result is not None:
+                    return result
+                value = condition(env)
+
+        return while_stmt
+
+    def visit_func_statement(self, func):
+        body = self.compile_scope(func.body)
+
+        def make_function(env):
+            return ClosureFunction(func, body, env, False)
+
+        return self.compile_define(func.name, make_function)
+
+    def visit_class_statement(self, stmt):
+        lexeme = stmt.name.lexeme
+        supercls_expr = self.compile(stmt.supercls) if stmt.supercls else None
+        methods = [
+            (method, self.compile_scope(method.body), method.name.lexeme == "init")
+            for method in stmt.methods
+        ]
+        globals = self.interpreter.globals if self.scope_depth == 0 else None
+
+        def class_stmt(env):
+            supercls = None
+            if supercls_expr:
+                supercls = supercls_expr(env)
+                if not isinstance(supercls, LoxClass):
+                    raise RunTimeError(
+                        stmt.supercls.name, "superclass must be a class."
+                    )
+
+            if globals is not None:
+                globals[lexeme] = None
+            else:
+                env.values.append(None)
+
+            closure = env
+            if supercls_expr:
+                closure = Environment(env, [supercls])
+
+            functions = {}
+            for method, body, init in methods:
+                functions[method.name.lexeme] = ClosureFunction(
+                    method, body, closure, init
+                )
+
+            cls = LoxClass(lexeme, supercls, functions)
+            if globals is not None:
+                globals[lexeme] = cls
+            else:
+                env.values[-1] = cls
+
+        return class_stmt
+
+    def visit_probe_stmt(self, stmt):
+        run = self.compile(stmt.stmt)
+
+        def probe_stmt(env):
+            stmt.hits += 1
+            return run(env)
+
+        return probe_stmt
+
+    def visit_return_statement(self, stmt):
+        if not stmt.expr:
+            return lambda env: (None,)
+
+        if stmt.tail:
+            call = self.compile_call(stmt.expr, True)
+
+            def tail_return(env):
+                result = call(env)
+                if type(result) is TailCall:
+                    return result
+                return (result,)
+
+            return tail_return
+
+        expr = self.compile(stmt.expr)
+
+        def return_stmt(env):
+            return (expr(env),)
+
+        return return_stmt
+
+    # expressions
+    def visit_literal_expr(self, expr):
+        value = expr.value
+        return lambda env: value
+
+    def visit_grouping_expr(self, expr):
+        return self.compile(expr.expr)
+
+    def visit_unary_expr(self, expr):
+        right = self.compile(expr.right)
+        op = expr.op
+        if op.type == TokenType.MINUS:
+
+            def negate(env):
+                value = right(env)
+                if type(value) is float:
+                    return -value
+                raise RunTimeError(op, "Operand must be a number.")
+
+            return negate
+
+        def bang(env):
+            value = right(env)
+            return value is None or value is False
+
+        return bang
+
+    def visit_binary_expr(self, expr):
+        left = self.compile(expr.left)
+        right = self.compile(expr.right)
+        op = expr.op
+
+        if op.type == TokenType.PLUS:
+
+            def plus(env):
+                lhs = left(env)
+                rhs = right(env)
+                if type(lhs) is float and type(rhs) is float:
+                    return lhs + rhs
+                if type(lhs) is str and type(rhs) is str:
+                    return lhs + rhs
+                raise RunTimeError(op, "Operands must be two numbers or two strings.")
+
+            return plus
+
+        if op.type == TokenType.SLASH:
+
+            def divide(env):
+                lhs = left(env)
+                rhs = right(env)
+                if type(lhs) is not float or type(rhs) is not float:
+                    raise RunTimeError(op, "Operands must be numbers.")
+                try:
+                    return lhs / rhs
+                except ZeroDivisionError:
+                    raise RunTimeError(op, "Division by zero.")
+
+            return divide
+
+        if op.type == TokenType.EQUAL_EQUAL:
+            return lambda env: left(env) == right(env)
+        if op.type == TokenType.BANG_EQUAL:
+            return lambda env: left(env) != right(env)
+
+        fn = NUMERIC_OPS[op.type]
+        constant = expr.right.value if isinstance(expr.right, LiteralExpr) else None
+        if type(constant) is float:
+            # the common `n - 1` / `i < 10` shape, the operand is baked in
+
+            def numeric_constant(env):
+                lhs = left(env)
+                if type(lhs) is float:
+                    return fn(lhs, constant)
+                raise RunTimeError(op, "Operands must be numbers.")
+
+            return numeric_constant
+
+        def numeric(env):
+            lhs = left(env)
+            rhs = right(env)
+            if type(lhs) is float and type(rhs) is float:
+                return fn(lhs, rhs)
+            raise RunTimeError(op, "Operands must be numbers.")
+
+        return numeric
+
+    def visit_logical_expr(self, expr):
+        left = self.compile(expr.left)
+        right = self.compile(expr.right)
+        if expr.op.type == TokenType.OR:
+
+            def logic_or(env):
+                value = left(env)
+                if value is not None and value is not False:
+                    return value
+                return right(env)
+
+            return logic_or
+
+        def logic_and(env):
+            value = left(env)
+            if value is None or value is False:
+                return value
+            return right(env)
+
+        return logic_and
+
+    def visit_probe_expr(self, expr):
+        value_expr = self.compile(expr.expr)
+
+        def probe_expr(env):
+            value = value_expr(env)
+            if value is None or value is False:
+                expr.falsy += 1
+            else:
+                expr.truthy += 1
+            return value
+
+        return probe_expr
+
+    def visit_variable_expr(self, expr):
+        return self.compile_lookup(expr, expr.name)
+
+    def visit_assign_expr(self, expr):
+        value_expr = self.compile(expr.expr)
+        name = expr.name
+        if expr.depth is None:
+            globals = self.interpreter.globals
+
+            def assign_global(env):
+                value = value_expr(env)
+                if name.lexeme not in globals:
+                    raise RunTimeError(name, f"Undefined variable '{name.lexeme}'.")
+                globals[name.lexeme] = value
+                return value
+
+            return assign_global
+
+        depth, slot = expr.depth, expr.slot
+
+        def assign(env):
+            value = value_expr(env)
+            env.ancestor(depth).values[slot] = value
+            return value
+
+        return assign
+
+    def visit_call_expr(self, expr):
+        return self.compile_call(expr, False)
+
+    def compile_call(self, expr, tail):
+        # a tail call hands Lox functions back as a TailCall instead of
+        # running them, anything else is called right away
+        if type(expr.callee) is GetExpr:
+            return self.compile_invoke(expr, tail)
+        if type(expr.callee) is SuperExpr:
+            return self.compile_super_invoke(expr, tail)
+
+        callee_expr = self.compile(expr.callee)
+        call_value = self.compile_call_value(expr, tail)
+
+        def call(env):
+            return call_value(callee_expr(env), env)
+
+        return call
+
+    def compile_call_value(self, expr, tail):
+        arg_exprs = tuple([self.compile(arg) for arg in expr.args])
+        paren = expr.paren
+        interpreter = self.interpreter
+        max_depth = interpreter.max_depth
+
+        def call_value(callee, env):
+            is_function = type(callee) is ClosureFunction
+            if not is_function and not hasattr(callee, "call"):
+                raise RunTimeError(paren, "can only call functions.")
+
+            args = [arg(env) for arg in arg_exprs]
+            if not is_function or len(args) != callee.param_count:
+                if len(args) != callee.arity():
+                    raise RunTimeError(
+                        paren,
+                        f"Expected {callee.arity()} arguments, {len(args)} provided.",
+                    )
+            elif tail:
+                return TailCall(callee, args)
+
+            if interpreter.depth == max_depth:
+                raise RunTimeError(paren, "Stack overflow.")
+            try:
+                return callee.call(interpreter, args)
+            except RecursionError:
+                raise RunTimeError(paren, "Stack overflow.") from None
+
+        return call_value
+
+    def compile_method_call(self, expr, tail):
+        # calls a method without binding it first, `this` goes straight into
+        # the first slot of the method's frame
+        arg_exprs = tuple([self.compile(arg) for arg in expr.args])
+        paren = expr.paren
+        interpreter = self.interpreter
+        max_depth = interpreter.max_depth
+
+        def method_call(receiver, method, env):
+            args = [receiver]
+            for arg in arg_exprs:
+                args.append(arg(env))
+            if len(args) - 1 != method.param_count:
+                raise RunTimeError(
+                    paren,
+                    f"Expected {method.param_count} arguments, {len(args) - 1} provided.",
+                )
+            if tail:
+                return TailCall(method, args)
+
+            if interpreter.depth == max_depth:
+                raise RunTimeError(paren, "Stack overflow.")
+            try:
+                return method.call(interpreter, args)
+            except RecursionError:
+                raise RunTimeError(paren, "Stack overflow.") from None
+
+        return method_call
+
+    def compile_invoke(self, expr, tail):
+        get = expr.callee
+        obj_expr = self.compile(get.obj)
+        get_property = self.compile_get_property(get)
+        method_call = self.compile_method_call(expr, tail)
+        call_value = self.compile_call_value(expr, tail)
+        name = get.name
+        lexeme = name.lexeme
+
+        def invoke(env):
+            obj = obj_expr(env)
+            if not isinstance(obj, LoxInstance) or field_offset(get, obj) is not None:
+                return call_value(get_property(obj), env)
+
+            method = find_method(get, obj.cls)
+            if method is None:
+                raise RunTimeError(name, f"Undefined property {lexeme}.")
+            return method_call(obj, method, env)
+
+        return invoke
+
+    def compile_super_invoke(self, expr, tail):
+        super_method = self.compile_super_method(expr.callee)
+        method_call = self.compile_method_call(expr, tail)
+        distance = expr.callee.depth
+
+        def super_invoke(env):
+            method = super_method(env)
+            return method_call(env.get_at(distance - 1, 0), method, env)
+
+        return super_invoke
+
+    def visit_get_expr(self, expr):
+        obj_expr = self.compile(expr.obj)
+        get_property = self.compile_get_property(expr)
+
+        def get(env):
+            return get_property(obj_expr(env))
+
+        return get
+
+    def compile_get_property(self, expr):
+        name = expr.name
+        lexeme = name.lexeme
+
+        def get_property(obj):
+            if not isinstance(obj, LoxInstance):
+                raise RunTimeError(name, "only instances can have properties.")
+
+            offset = field_offset(expr, obj)
+            if offset is not None:
+                return obj.values[offset]
+
+            method = find_method(expr, obj.cls)
+            if method is None:
+                raise RunTimeError(name, f"Undefined property {lexeme}.")
+            return method.bind(obj)
+
+        return get_property
+
+    def visit_set_expr(self, expr):
+        obj_expr = self.compile(expr.obj)
+        value_expr = self.compile(expr.value)
+        name = expr.name
+
+        def set(env):
+            obj = obj_expr(env)
+            if not isinstance(obj, LoxInstance):
+                raise RunTimeError(name, "only instances can set properties.")
+
+            value = value_expr(env)
+            set_field(expr, obj, value)
+            return value
+
+        return set
+
+    def visit_this_expr(self, expr):
+        return self.compile_lookup(expr, expr.keyword)
+
+    def visit_super_expr(self, expr):
+        super_method = self.compile_super_method(expr)
+        distance = expr.depth
+
+        def super_expr(env):
+            method = super_method(env)
+            return method.bind(env.get_at(distance - 1, 0))
+
+        return super_expr
+
+    def compile_super_method(self, expr):
+        distance = expr.depth
+        method_name = expr.method
+
+        def super_method(env):
+            supercls = env.get_at(distance, 0)
+            method = supercls.get_method(method_name.lexeme)
+            if not method:
+                raise RunTimeError(
+                    method_name, f"Undefined property {method_name.lexeme}."
+                )
+            return method
+
+        return super_method
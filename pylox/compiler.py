@@ -0,0 +1,362 @@
+from chunk import *
+from tokens import TokenType
+from expressions import GetExpr, SuperExpr
+from resolver import FunctionType
+
+BINARY_OPS = {
+    TokenType.EQUAL_EQUAL: OP_EQUAL,
+    TokenType.BANG_EQUAL: OP_NOT_EQUAL,
+    TokenType.GREATER: OP_GREATER,
+    TokenType.GREATER_EQUAL: OP_GREATER_EQUAL,
+    TokenType.LESS: OP_LESS,
+    TokenType.LESS_EQUAL: OP_LESS_EQUAL,
+    TokenType.PLUS: OP_ADD,
+    TokenType.MINUS: OP_SUBTRACT,
+    TokenType.STAR: OP_MULTIPLY,
+    TokenType.SLASH: OP_DIVIDE,
+}
+
+
+class Local:
+    __slots__ = ("name", "depth", "is_captured")
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.is_captured = False
+
+
+class FunctionState:
+    def __init__(self, enclosing, type, name, arity):
+        self.enclosing = enclosing
+        self.type = type
+        self.function = ObjFunction(name, arity)
+        # slot zero holds the callee, or the receiver for methods
+        receiver = (
+            "this" if type in (FunctionType.METHOD, FunctionType.INITIALIZER) else ""
+        )
+        self.locals = [Local(receiver, 0)]
+        self.upvalues = []
+        self.scope_depth = 0
+
+
+class Compiler:
+    """
+    Compiles a resolved program into bytecode for the VM. The Resolver has
+    already reported every static error, so the compiler only has to lay out
+    locals on the stack and work out which of them are captured by closures.
+    """
+
+    def __init__(self):
+        self.state = None
+        self.line = 1
+
+    def compile(self, statements):
+        self.state = FunctionState(None, FunctionType.NONE, "", 0)
+        for stmt in statements:
+            stmt.accept(self)
+
+        self.emit_return()
+        return self.state.function
+
+    # emitting
+    @property
+    def chunk(self):
+        return self.state.function.chunk
+
+    def emit(self, *values, line=None):
+        line = self.line if line is None else line
+        for value in values:
+            self.chunk.write(value, line)
+
+    def emit_constant_op(self, op, value, line=None):
+        self.emit(op, self.chunk.add_constant(value), line=line)
+
+    def emit_jump(self, op):
+        self.emit(op, 0)
+        return len(self.chunk.code) - 1
+
+    def patch_jump(self, offset):
+        self.chunk.code[offset] = len(self.chunk.code) - offset - 1
+
+    def emit_loop(self, start):
+        self.emit(OP_LOOP, 0)
+        self.chunk.code[-1] = len(self.chunk.code) - start
+
+    def emit_return(self):
+        if self.state.type == FunctionType.INITIALIZER:
+            self.emit(OP_GET_LOCAL, 0)
+        else:
+            self.emit(OP_NIL)
+        self.emit(OP_RETURN)
+
+    # scopes and variables
+    def begin_scope(self):
+        self.state.scope_depth += 1
+
+    def end_scope(self):
+        state = self.state
+        state.scope_depth -= 1
+        while state.locals and state.locals[-1].depth > state.scope_depth:
+            if state.locals.pop().is_captured:
+                self.emit(OP_CLOSE_UPVALUE)
+            else:
+                self.emit(OP_POP)
+
+    def add_local(self, name):
+        self.state.locals.append(Local(name, self.state.scope_depth))
+
+    def define_variable(self, name):
+        # the value is on top of the stack, which is exactly where a local lives
+        if self.state.scope_depth > 0:
+            self.add_local(name.lexeme)
+        else:
+            self.emit_constant_op(OP_DEFINE_GLOBAL, name.lexeme, line=name.line)
+
+    def resolve_local(self, state, lexeme):
+        for idx in range(len(state.locals) - 1, -1, -1):
+            if state.locals[idx].name == lexeme:
+                return idx
+        return None
+
+    def add_upvalue(self, state, index, is_local):
+        for idx, upvalue in enumerate(state.upvalues):
+            if upvalue == (is_local, index):
+                return idx
+
+        state.upvalues.append((is_local, index))
+        state.function.upvalue_count = len(state.upvalues)
+        return len(state.upvalues) - 1
+
+    def resolve_upvalue(self, state, lexeme):
+        if state.enclosing is None:
+            return None
+
+        local = self.resolve_local(state.enclosing, lexeme)
+        if local is not None:
+            state.enclosing.locals[local].is_captured = True
+            return self.add_upvalue(state, local, True)
+
+        upvalue = self.resolve_upvalue(state.enclosing, lexeme)
+        if upvalue is not None:
+            return self.add_upvalue(state, upvalue, False)
+
+        return None
+
+    def named_variable(self, lexeme, line, assign=False):
+        slot = self.resolve_local(self.state, lexeme)
+        if slot is not None:
+            self.emit(OP_SET_LOCAL if assign else OP_GET_LOCAL, slot)
+            return
+
+        upvalue = self.resolve_upvalue(self.state, lexeme)
+        if upvalue is not None:
+            self.emit(OP_SET_UPVALUE if assign else OP_GET_UPVALUE, upvalue)
+            return
+
+        op = OP_SET_GLOBAL if assign else OP_GET_GLOBAL
+        self.emit_constant_op(op, lexeme, line=line)
+
+    def function(self, stmt, type):
+        self.line = stmt.name.line
+        self.state = FunctionState(self.state, type, stmt.name.lexeme, len(stmt.params))
+        self.begin_scope()
+        for param in stmt.params:
+            self.add_local(param.lexeme)
+        for body_stmt in stmt.body:
+            body_stmt.accept(self)
+        self.emit_return()
+
+        state = self.state
+        self.state = state.enclosing
+        self.emit_constant_op(OP_CLOSURE, state.function)
+        for is_local, index in state.upvalues:
+            self.emit(1 if is_local else 0, index)
+
+    # statements
+    def visit_print_stmt(self, stmt):
+        stmt.expr.accept(self)
+        self.emit(OP_PRINT)
+
+    def visit_assert_stmt(self, stmt):
+        self.line = stmt.token.line
+        stmt.expr.accept(self)
+        self.emit(OP_ASSERT, line=stmt.token.line)
+
+    def visit_expr_stmt(self, stmt):
+        stmt.expr.accept(self)
+        self.emit(OP_POP)
+
+    def visit_var_stmt(self, stmt):
+        self.line = stmt.name.line
+        if stmt.expr:
+            stmt.expr.accept(self)
+        else:
+            self.emit(OP_NIL)
+        self.define_variable(stmt.name)
+
+    def visit_block_stmt(self, stmt):
+        self.begin_scope()
+        for block_stmt in stmt.stmts:
+            block_stmt.accept(self)
+        self.end_scope()
+
+    def visit_if_statement(self, stmt):
+        stmt.condition.accept(self)
+        then_jump = self.emit_jump(OP_POP_JUMP_IF_FALSE)
+        stmt.then.accept(self)
+        if not stmt.otherwise:
+            self.patch_jump(then_jump)
+            return
+
+        else_jump = self.emit_jump(OP_JUMP)
+        self.patch_jump(then_jump)
+        stmt.otherwise.accept(self)
+        self.patch_jump(else_jump)
+
+    def visit_while_statement(self, stmt):
+        start = len(self.chunk.code)
+        stmt.condition.accept(self)
+        exit_jump = self.emit_jump(OP_POP_JUMP_IF_FALSE)
+        stmt.stmt.accept(self)
+        self.emit_loop(start)
+        self.patch_jump(exit_jump)
+
+    def visit_func_statement(self, stmt):
+        if self.state.scope_depth > 0:
+            # declared before the body is compiled, so it can call itself
+            self.add_local(stmt.name.lexeme)
+            self.function(stmt, FunctionType.FUNCTION)
+        else:
+            self.function(stmt, FunctionType.FUNCTION)
+            self.define_variable(stmt.name)
+
+    def visit_class_statement(self, stmt):
+        name = stmt.name
+        self.line = name.line
+        self.emit_constant_op(OP_CLASS, name.lexeme)
+        self.define_variable(name)
+
+        if stmt.supercls:
+            self.begin_scope()
+            self.line = stmt.supercls.name.line
+            self.named_variable(stmt.supercls.name.lexeme, stmt.supercls.name.line)
+            self.add_local("super")
+            self.named_variable(name.lexeme, name.line)
+            self.emit(OP_INHERIT, line=stmt.supercls.name.line)
+
+        self.named_variable(name.lexeme, name.line)
+        for method in stmt.methods:
+            type = FunctionType.METHOD
+            if method.name.lexeme == "init":
+                type = FunctionType.INITIALIZER
+            self.function(method, type)
+            self.emit_constant_op(OP_METHOD, method.name.lexeme)
+        self.emit(OP_POP)
+
+        if stmt.supercls:
+            self.end_scope()
+
+    def visit_return_statement(self, stmt):
+        self.line = stmt.keyword.line
+        if self.state.type == FunctionType.INITIALIZER:
+            self.emit(OP_GET_LOCAL, 0)
+        elif stmt.expr:
+            stmt.expr.accept(self)
+        else:
+            self.emit(OP_NIL)
+        self.emit(OP_RETURN)
+
+    # expressions
+    def visit_literal_expr(self, expr):
+        if expr.value is None:
+            self.emit(OP_NIL)
+        elif expr.value is True:
+            self.emit(OP_TRUE)
+        elif expr.value is False:
+            self.emit(OP_FALSE)
+        else:
+            self.emit_constant_op(OP_CONSTANT, expr.value)
+
+    def visit_grouping_expr(self, expr):
+        expr.expr.accept(self)
+
+    def visit_unary_expr(self, expr):
+        expr.right.accept(self)
+        op = OP_NEGATE if expr.op.type == TokenType.MINUS else OP_NOT
+        self.emit(op, line=expr.op.line)
+
+    def visit_binary_expr(self, expr):
+        expr.left.accept(self)
+        expr.right.accept(self)
+        self.emit(BINARY_OPS[expr.op.type], line=expr.op.line)
+
+    def visit_logical_expr(self, expr):
+        expr.left.accept(self)
+        if expr.op.type == TokenType.OR:
+            else_jump = self.emit_jump(OP_JUMP_IF_FALSE)
+            end_jump = self.emit_jump(OP_JUMP)
+            self.patch_jump(else_jump)
+        else:
+            end_jump = self.emit_jump(OP_JUMP_IF_FALSE)
+
+        self.emit(OP_POP)
+        expr.right.accept(self)
+        self.patch_jump(end_jump)
+
+    def visit_variable_expr(self, expr):
+        self.line = expr.name.line
+        self.named_variable(expr.name.lexeme, expr.name.line)
+
+    def visit_assign_expr(self, expr):
+        expr.expr.accept(self)
+        self.line = expr.name.line
+        self.named_variable(expr.name.lexeme, expr.name.line, assign=True)
+
+    def visit_call_expr(self, expr):
+        callee = expr.callee
+        if isinstance(callee, GetExpr):
+            callee.obj.accept(self)
+            for arg in expr.args:
+                arg.accept(self)
+            # a failed lookup is reported at the name, a failed call at the
+            # paren, like a get followed by a call
+            name = self.chunk.add_constant(callee.name.lexeme)
+            self.emit(OP_INVOKE, name, line=callee.name.line)
+            self.emit(len(expr.args), line=expr.paren.line)
+            return
+
+        if isinstance(callee, SuperExpr):
+            line = callee.keyword.line
+            self.named_variable("this", line)
+            for arg in expr.args:
+                arg.accept(self)
+            self.named_variable("super", line)
+            name = self.chunk.add_constant(callee.method.lexeme)
+            self.emit(OP_SUPER_INVOKE, name, line=callee.method.line)
+            self.emit(len(expr.args), line=expr.paren.line)
+            return
+
+        callee.accept(self)
+        for arg in expr.args:
+            arg.accept(self)
+        self.emit(OP_CALL, len(expr.args), line=expr.paren.line)
+
+    def visit_get_expr(self, expr):
+        expr.obj.accept(self)
+        self.emit_constant_op(OP_GET_PROPERTY, expr.name.lexeme, line=expr.name.line)
+
+    def visit_set_expr(self, expr):
+        expr.obj.accept(self)
+        expr.value.accept(self)
+        self.emit_constant_op(OP_SET_PROPERTY, expr.name.lexeme, line=expr.name.line)
+
+    def visit_this_expr(self, expr):
+        self.line = expr.keyword.line
+        self.named_variable("this", expr.keyword.line)
+
+    def visit_super_expr(self, expr):
+        self.line = expr.keyword.line
+        self.named_variable("this", expr.keyword.line)
+        self.named_variable("super", expr.keyword.line)
+        self.emit_constant_op(OP_GET_SUPER, expr.method.lexeme, line=expr.method.line)
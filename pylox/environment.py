@@ -0,0 +1,27 @@
+class Environment:
+    """
+    A local scope. The Resolver hands out a slot per variable in declaration
+    order, so variables live in a plain list and are defined by appending.
+    Globals are kept by name in the Interpreter instead.
+    """
+
+    __slots__ = ("values", "enclosing")
+
+    def __init__(self, enclosing=None, values=None):
+        self.values = [] if values is None else values
+        self.enclosing = enclosing
+
+    def define(self, value):
+        self.values.append(value)
+
+    def get_at(self, depth, slot):
+        return self.ancestor(depth).values[slot]
+
+    def assign_at(self, depth, slot, value):
+        self.ancestor(depth).values[slot] = value
+
+    def ancestor(self, depth):
+        env = self
+        for i in range(depth):
+            env = env.enclosing
+        return env
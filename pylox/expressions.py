@@ -13,16 +13,21 @@ expression_types = [
     "super",
     "this",
     "variable",
+    "probe",
 ]
 
 
 class Expr(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def accept(visitor):
         pass
 
 
 class LiteralExpr(Expr):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -31,6 +36,8 @@ class LiteralExpr(Expr):
 
 
 class UnaryExpr(Expr):
+    __slots__ = ("op", "right")
+
     def __init__(self, op, right):
         self.op = op
         self.right = right
@@ -40,6 +47,8 @@ class UnaryExpr(Expr):
 
 
 class BinaryExpr(Expr):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
@@ -50,6 +59,8 @@ class BinaryExpr(Expr):
 
 
 class LogicalExpr(Expr):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
@@ -60,6 +71,8 @@ class LogicalExpr(Expr):
 
 
 class GroupingExpr(Expr):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -68,63 +81,109 @@ class GroupingExpr(Expr):
 
 
 class VariableExpr(Expr):
+    __slots__ = ("name", "depth", "slot")
+
     def __init__(self, name):
         self.name = name
+        # filled in by the Resolver for local variables
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visit_variable_expr(self)
 
 
 class AssignExpr(Expr):
+    __slots__ = ("name", "expr", "depth", "slot")
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visit_assign_expr(self)
 
 
 class CallExpr(Expr):
+    __slots__ = ("callee", "paren", "args")
+
     def __init__(self, callee, paren, args):
         self.callee = callee
         self.paren = paren
-        self.args = args
+        self.args = tuple(args)
 
     def accept(self, visitor):
         return visitor.visit_call_expr(self)
 
 
 class GetExpr(Expr):
+    __slots__ = ("obj", "name", "cls", "method", "cache", "shape", "offset")
+
     def __init__(self, obj, name):
         self.obj = obj
         self.name = name
+        # inline caches, see interpreter.find_method and field_offset
+        self.cls = None
+        self.method = None
+        self.cache = None
+        self.shape = None
+        self.offset = None
 
     def accept(self, visitor):
         return visitor.visit_get_expr(self)
 
 
 class SetExpr(Expr):
+    __slots__ = ("obj", "name", "value", "shape", "offset", "transition")
+
     def __init__(self, obj, name, value):
         self.obj = obj
         self.name = name
         self.value = value
+        # inline cache, see interpreter.set_field
+        self.shape = None
+        self.offset = None
+        self.transition = None
 
     def accept(self, visitor):
         return visitor.visit_set_expr(self)
 
 
 class ThisExpr(Expr):
+    __slots__ = ("keyword", "depth", "slot")
+
     def __init__(self, keyword):
         self.keyword = keyword
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visit_this_expr(self)
 
 
 class SuperExpr(Expr):
+    __slots__ = ("keyword", "method", "depth", "slot")
+
     def __init__(self, keyword, method):
         self.keyword = keyword
         self.method = method
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visit_super_expr(self)
+
+
+class ProbeExpr(Expr):
+    # wraps a condition for line_coverage.py, counting how it turned out
+    __slots__ = ("expr", "truthy", "falsy")
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.truthy = 0
+        self.falsy = 0
+
+    def accept(self, visitor):
+        return visitor.visit_probe_expr(self)
@@ -1,5 +1,39 @@
+import contextlib
+import sys
+
 from lox import Lox
 from tokens import *
+from expressions import GetExpr, SuperExpr
+from environment import Environment
+
+# How deeply Lox calls may nest before a "Stack overflow." error. Since
+# CPython 3.11 a python function calling another python function keeps both
+# frames on the heap, so the recursion limit is raised to match. That only
+# holds for plain calls: a call made from C, such as a generator drained by
+# tuple() or a class calling __init__, takes C stack for every level, which
+# the raised limit no longer protects. The interpreters, the compilers and
+# the optimizer never recurse through C, and report running out of the limit
+# as a Lox error. Code that can't help it, like the python backend, runs
+# under c_stack_limit(). A tree-walking call costs a few kilobytes.
+DEFAULT_MAX_DEPTH = 100_000
+PYTHON_FRAMES_PER_CALL = 50
+C_STACK_LIMIT = 1000  # python's own default, which any C stack can hold
+
+
+def make_room(max_depth):
+    limit = max_depth * PYTHON_FRAMES_PER_CALL
+    if sys.getrecursionlimit() < limit:
+        sys.setrecursionlimit(limit)
+
+
+@contextlib.contextmanager
+def c_stack_limit():
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(min(limit, C_STACK_LIMIT))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
 
 
 class RunTimeError(Exception):
@@ -8,90 +42,165 @@ class RunTimeError(Exception):
         self.token = token
 
 
-class Return(Exception):
-    def __init__(self, value):
-        self.value = value
+class TailCall:
+    # what a `return f(...)` in tail position completes with: the function
+    # to run next and its frame, in place of the function returning it
+    __slots__ = ("function", "args")
 
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
 
-class Environment:
-    def __init__(self, enclosing=None):
-        self.values = {}
-        self.enclosing = enclosing
 
-    def define(self, name, value):
-        self.values[name] = value
+class LoxFunction:
+    def __init__(self, stmt, closure, init):
+        self.stmt = stmt
+        self.closure = closure
+        self.init = init
+        self.param_count = len(stmt.params)
 
-    def assign(self, name, value):
-        if name.lexeme in self.values:
-            self.values[name.lexeme] = value
-            return
+    def arity(self):
+        return self.param_count
 
-        if self.enclosing:
-            return self.enclosing.assign(name, value)
+    def call(self, interpreter, args):
+        # The argument list becomes the frame: parameters take the first
+        # slots, in order. A method gets `this` in front of them.
+        function = self
+        interpreter.depth += 1
+        try:
+            while True:
+                result = interpreter.execute_block(
+                    function.stmt.body, Environment(function.closure, args)
+                )
+                if type(result) is not TailCall:
+                    break
+                # trampoline, so tail calls don't grow the python stack
+                function, args = result.function, result.args
+        finally:
+            interpreter.depth -= 1
 
-        raise RunTimeError(name, f"Undefined variable '{name.lexeme}'.")
+        # in a construtor, we always want to return the object
+        if function.init:
+            return args[0]
+        if result is not None:
+            return result[0]
 
-    def assign_at(self, depth, name, value):
-        self.ancestor(depth).values[name.lexeme] = value
+    def bind(self, instance):
+        return BoundMethod(self, instance)
 
-    def get(self, name):
-        if name.lexeme in self.values:
-            return self.values[name.lexeme]
+    def __str__(self):
+        return f"<fn {self.stmt.name.lexeme}>"
 
-        if self.enclosing:
-            return self.enclosing.get(name)
 
-        raise RunTimeError(name, f"Undefined variable '{name.lexeme}'.")
+class BoundMethod:
+    # a method read off an instance as a value, method calls don't make one
+    __slots__ = ("method", "receiver")
 
-    def get_at(self, depth, lexeme):
-        return self.ancestor(depth).values[lexeme]
+    def __init__(self, method, receiver):
+        self.method = method
+        self.receiver = receiver
 
-    def ancestor(self, depth):
-        env = self
-        for i in range(depth):
-            env = env.enclosing
-        return env
+    def arity(self):
+        return self.method.arity()
 
+    def call(self, interpreter, args):
+        return self.method.call(interpreter, [self.receiver, *args])
 
-class LoxFunction:
-    def __init__(self, stmt, closure, init):
-        self.stmt = stmt
-        self.closure = closure
-        self.init = init
+    def __str__(self):
+        return str(self.method)
 
-    def arity(self):
-        return len(self.stmt.params)
 
-    def call(self, interpreter, args):
-        env = Environment(enclosing=self.closure)
-        for param, arg in zip(self.stmt.params, args):  # strict zip
-            env.define(param.lexeme, arg)
+MAX_POLYMORPHISM = 4
 
-        try:
-            interpreter.execute_block(self.stmt.body, env)
-        except Return as ex:
-            # in a construtor, we always want to return the object
-            if self.init:
-                return self.closure.get_at(0, "this")
-            return ex.value
 
-        if self.init:
-            return self.closure.get_at(0, "this")
+def find_method(site, cls):
+    # Looks up the method a GetExpr names on the given class. Classes never
+    # change once created, so the result is remembered on the expression: the
+    # last class seen there, and up to MAX_POLYMORPHISM others in a dict.
+    if site.cls is cls:
+        return site.method
 
-    def bind(self, instance):
-        env = Environment(self.closure)
-        env.define("this", instance)
-        return LoxFunction(self.stmt, env, self.init)
+    cache = site.cache
+    if cache is not None and cls in cache:
+        method = cache[cls]
+    else:
+        method = cls.get_method(site.name.lexeme)
+        if cache is None:
+            site.cache = cache = {}
+        if len(cache) < MAX_POLYMORPHISM:
+            cache[cls] = method
+
+    site.cls = cls
+    site.method = method
+    return method
+
+
+def field_offset(site, obj):
+    # Where the field a GetExpr names lives in obj.values, None if obj has no
+    # such field. The answer only depends on the shape, so the last one is
+    # remembered on the expression.
+    shape = obj.shape
+    if shape is not site.shape:
+        site.shape = shape
+        site.offset = shape.offsets.get(site.name.lexeme)
+    return site.offset
+
+
+def set_field(site, obj, value):
+    # Likewise for a SetExpr, which either overwrites a field at a known
+    # offset or adds the field, moving obj to the next shape.
+    shape = obj.shape
+    if shape is not site.shape:
+        site.shape = shape
+        site.offset = shape.offsets.get(site.name.lexeme)
+        if site.offset is None:
+            site.transition = shape.add(site.name.lexeme)
+
+    if site.offset is None:
+        obj.shape = site.transition
+        obj.values.append(value)
+    else:
+        obj.values[site.offset] = value
+
+
+class Shape:
+    """
+    The layout shared by all instances that got the same fields in the same
+    order: field name -> offset into LoxInstance.values. Adding a field moves
+    an instance to another shape, and those transitions are cached so that
+    instances built the same way end up with the very same Shape object.
+    """
+
+    __slots__ = ("offsets", "transitions")
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+        self.transitions = {}
+
+    def add(self, name):
+        shape = self.transitions.get(name)
+        if shape is None:
+            offsets = dict(self.offsets)
+            offsets[name] = len(offsets)
+            shape = self.transitions[name] = Shape(offsets)
+        return shape
+
+
+EMPTY_SHAPE = Shape({})
 
 
 class LoxInstance:
+    __slots__ = ("cls", "shape", "values")
+
     def __init__(self, cls):
         self.cls = cls
-        self.fields = {}
+        self.shape = EMPTY_SHAPE
+        self.values = []
 
     def get(self, name):
-        if name.lexeme in self.fields:
-            return self.fields[name.lexeme]
+        offset = self.shape.offsets.get(name.lexeme)
+        if offset is not None:
+            return self.values[offset]
 
         method = self.cls.get_method(name.lexeme)
         if method:
@@ -100,7 +209,15 @@ class LoxInstance:
         raise RunTimeError(name, f"Undefined property {name.lexeme}.")
 
     def set(self, name, value):
-        self.fields[name.lexeme] = value
+        offset = self.shape.offsets.get(name.lexeme)
+        if offset is None:
+            self.shape = self.shape.add(name.lexeme)
+            self.values.append(value)
+        else:
+            self.values[offset] = value
+
+    def __str__(self):
+        return f"{self.cls.name} instance"
 
 
 class LoxClass:
@@ -108,34 +225,86 @@ class LoxClass:
         self.name = name
         self.supercls = supercls
         self.methods = methods
+        # Classes can't change once created, so inherited methods are merged
+        # into one table up front and no lookup has to walk the superclasses.
+        self.table = dict(supercls.table) if supercls else {}
+        self.table.update(methods)
+        self.initializer = self.table.get("init")
+        self.init_arity = self.initializer.arity() if self.initializer else 0
 
     def get_method(self, name):
-        if name in self.methods:
-            return self.methods[name]
-
-        if self.supercls:
-            return self.supercls.get_method(name)
-
-        return None
+        return self.table.get(name)
 
     def call(self, interpreter, args):
         instance = LoxInstance(self)  # allocation
-        init = self.get_method("init")
-        if init:
-            init.bind(instance).call(interpreter, args)
+        if self.initializer:
+            self.initializer.call(interpreter, [instance, *args])
 
         return instance
 
     def arity(self):
-        init = self.get_method("init")
-        if init:
-            return init.arity()
+        return self.init_arity
+
+    def __str__(self):
+        return self.name
+
+
+class HookedFunction(LoxFunction):
+    def call(self, interpreter, args):
+        # LoxFunction.call, reporting each function it runs. A function a
+        # tail call replaces exits without a value.
+        function = self
+        interpreter.depth += 1
+        try:
+            while True:
+                interpreter.emit("enter", function, args)
+                result = interpreter.execute_block(
+                    function.stmt.body, Environment(function.closure, args)
+                )
+                if type(result) is not TailCall:
+                    break
+                interpreter.emit("exit", function, None)
+                function, args = result.function, result.args
+        finally:
+            interpreter.depth -= 1
+
+        value = None
+        if function.init:
+            value = args[0]
+        elif result is not None:
+            value = result[0]
+        interpreter.emit("exit", function, value)
+        return value
+
+
+class HookedClass(LoxClass):
+    def call(self, interpreter, args):
+        interpreter.emit("enter", self, args)
+        instance = LoxInstance(self)
+        interpreter.emit("instance", instance)
+        if self.initializer:
+            self.initializer.call(interpreter, [instance, *args])
+
+        interpreter.emit("exit", self, instance)
+        return instance
 
-        return 0
+
+# The attributes of an Interpreter that subscribing to an event swaps for
+# their hooked_ versions, for as long as anyone listens to it. Nothing else
+# looks for listeners, so events no one listens to cost nothing.
+HOOKS = {
+    "enter": ("function_type", "class_type"),
+    "exit": ("function_type", "class_type"),
+    "instance": ("class_type",),
+    "get": ("get_property", "invoke"),
+    "set": ("visit_set_expr",),
+    "statement": ("execute", "execute_block"),
+    "error": (),
+}
 
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, max_depth=None):
         class Clock:
             def arity(self):
                 return 0
@@ -145,30 +314,138 @@ class Interpreter:
 
                 return time.time()
 
-        self.globals = Environment()
-        self.globals.define("clock", Clock())
-        self.env = self.globals
-        self.locals = {}
+            def __str__(self):
+                return "<native fn>"
+
+        self.globals = {"clock": Clock()}
+        self.env = None  # top level code runs against the globals
+        self.depth = 0  # Lox calls currently running
+        self.function_type = LoxFunction  # what Lox functions are made of
+        self.class_type = LoxClass
+        self.max_depth = max_depth or DEFAULT_MAX_DEPTH
+        self.listeners = {}  # event -> tuple of listeners
+        self.unhooked = {}  # hooked attribute -> what it was before
+        make_room(self.max_depth)
 
     def interpret(self, statements):
         try:
             for statement in statements:
                 self.execute(statement)
         except RunTimeError as ex:
+            self.emit("error", ex)
             Lox.runtime_error(ex)
 
-    def resolve(self, expr, depth):
-        self.locals[expr] = depth
+    # events
+    def subscribe(self, event, listener):
+        """
+        Calls listener on every event of a kind, with:
+
+            enter      (callee, args) as a function or class is called
+            exit       (callee, value) as it returns
+            instance   (instance) as a class makes an instance
+            get        (instance, name, value) as a property is read
+            set        (instance, name, value) as a property is written
+            statement  (stmt) before a statement runs
+            error      (error) as a runtime error stops the program
+
+        A method's args start with the instance it was called on. Calls a
+        runtime error unwinds don't exit. Functions and classes made before
+        the first listener for enter, exit or instance don't report them.
+        """
+        if event not in HOOKS:
+            raise ValueError(f"unknown event '{event}'")
+
+        self.listeners[event] = (*self.listeners.get(event, ()), listener)
+        for name in HOOKS[event]:
+            if name not in self.unhooked:
+                self.unhooked[name] = self.__dict__.get(name)
+                setattr(self, name, getattr(self, "hooked_" + name))
+
+    def unsubscribe(self, event, listener):
+        listeners = list(self.listeners[event])
+        listeners.remove(listener)
+        if listeners:
+            self.listeners[event] = tuple(listeners)
+            return
+
+        del self.listeners[event]
+        needed = {name for event in self.listeners for name in HOOKS[event]}
+        for name in [name for name in self.unhooked if name not in needed]:
+            original = self.unhooked.pop(name)
+            if original is None:
+                delattr(self, name)
+            else:
+                setattr(self, name, original)
+
+    def emit(self, event, *args):
+        for listener in self.listeners.get(event, ()):
+            listener(*args)
+
+    # what subscribing swaps in, see HOOKS
+    hooked_function_type = HookedFunction
+    hooked_class_type = HookedClass
+
+    def hooked_execute(self, stmt):
+        self.emit("statement", stmt)
+        return type(self).execute(self, stmt)
+
+    def hooked_execute_block(self, stmts, env):
+        previous = self.env
+        try:
+            self.env = env
+            for stmt in stmts:
+                result = self.execute(stmt)
+                if result is not None:
+                    return result
+        finally:
+            self.env = previous
+
+    def hooked_get_property(self, expr, obj):
+        value = type(self).get_property(self, expr, obj)
+        self.emit("get", obj, expr.name.lexeme, value)
+        return value
+
+    def hooked_invoke(self, receiver, method, expr, tail=False):
+        # a method called right away is read off its instance too
+        if type(expr.callee) is GetExpr:
+            self.emit("get", receiver, expr.callee.name.lexeme, method.bind(receiver))
+        return type(self).invoke(self, receiver, method, expr, tail)
+
+    def hooked_visit_set_expr(self, expr):
+        obj = self.evaluate(expr.obj)
+        if not isinstance(obj, LoxInstance):
+            raise RunTimeError(expr.name, "only instances can set properties.")
+
+        value = self.evaluate(expr.value)
+        set_field(expr, obj, value)
+        self.emit("set", obj, expr.name.lexeme, value)
+        return value
+
+    def resolve(self, expr, depth, slot):
+        expr.depth = depth
+        expr.slot = slot
 
     def lookup_variable(self, name, expr):
-        depth = self.locals.get(expr)
-        if depth is not None:
-            return self.env.get_at(depth, name.lexeme)
-        return self.globals.get(name)
+        if expr.depth is not None:
+            return self.env.get_at(expr.depth, expr.slot)
+
+        try:
+            return self.globals[name.lexeme]
+        except KeyError:
+            raise RunTimeError(name, f"Undefined variable '{name.lexeme}'.")
+
+    def define(self, name, value):
+        if self.env is None:
+            self.globals[name.lexeme] = value
+        else:
+            self.env.define(value)
 
     # statements
+    # Statements return None when they complete normally. An executed
+    # `return` produces a one element tuple holding the returned value, which
+    # every enclosing statement hands on up to the function call.
     def execute(self, stmt):
-        stmt.accept(self)
+        return stmt.accept(self)
 
     def visit_print_stmt(self, stmt):
         value = self.evaluate(stmt.expr)
@@ -187,34 +464,38 @@ class Interpreter:
         if stmt.expr:
             value = self.evaluate(stmt.expr)
 
-        self.env.define(stmt.name.lexeme, value)
+        self.define(stmt.name, value)
 
     def visit_block_stmt(self, stmt):
-        self.execute_block(stmt.stmts, Environment(self.env))
+        return self.execute_block(stmt.stmts, Environment(self.env))
 
     def execute_block(self, stmts, env):
         previous = self.env
         try:
             self.env = env
             for stmt in stmts:
-                self.execute(stmt)
+                result = stmt.accept(self)
+                if result is not None:
+                    return result
         finally:
             self.env = previous
 
     def visit_if_statement(self, stmt):
         value = self.evaluate(stmt.condition)
         if self.is_truthy(value):
-            self.execute(stmt.then)
+            return self.execute(stmt.then)
         else:
             if stmt.otherwise:
-                self.execute(stmt.otherwise)
+                return self.execute(stmt.otherwise)
 
     def visit_while_statement(self, stmt):
         while self.is_truthy(self.evaluate(stmt.condition)):
-            self.execute(stmt.stmt)
+            result = self.execute(stmt.stmt)
+            if result is not None:
+                return result
 
     def visit_func_statement(self, func):
-        self.env.define(func.name.lexeme, LoxFunction(func, self.env, False))
+        self.define(func.name, self.function_type(func, self.env, False))
 
     def visit_class_statement(self, stmt):
         supercls = None
@@ -225,31 +506,43 @@ class Interpreter:
 
         # That two-stage variable binding process allows references
         # to the class inside its own methods.
-        self.env.define(stmt.name.lexeme, None)
+        self.define(stmt.name, None)
 
         if stmt.supercls:
-            self.env = Environment(self.env)
-            self.env.define("super", supercls)
+            self.env = Environment(self.env, [supercls])
 
         methods = {}
         for method in stmt.methods:
-            methods[method.name.lexeme] = LoxFunction(
+            methods[method.name.lexeme] = self.function_type(
                 method, self.env, method.name.lexeme == "init"
             )
 
-        cls = LoxClass(stmt.name.lexeme, supercls, methods)
+        cls = self.class_type(stmt.name.lexeme, supercls, methods)
 
         if stmt.supercls:
             self.env = self.env.enclosing
 
-        self.env.define(stmt.name.lexeme, cls)
+        if self.env is None:
+            self.globals[stmt.name.lexeme] = cls
+        else:
+            self.env.values[-1] = cls  # nothing was defined after the name
+
+    def visit_probe_stmt(self, stmt):
+        stmt.hits += 1
+        return stmt.stmt.accept(self)
 
     def visit_return_statement(self, stmt):
+        if stmt.tail:
+            result = self.visit_call_expr(stmt.expr, True)
+            if type(result) is TailCall:
+                return result
+            return (result,)
+
         value = None
         if stmt.expr:
             value = self.evaluate(stmt.expr)
 
-        raise Return(value)
+        return (value,)
 
     # expressions
     def evaluate(self, expr):
@@ -311,7 +604,7 @@ class Interpreter:
         # You can’t ask lox if 3 is less than "three", but you can ask if it’s equal to it.
         if op.type == TokenType.EQUAL_EQUAL:
             return left == right
-        if op.type != TokenType.BANG_EQUAL:
+        if op.type == TokenType.BANG_EQUAL:
             return left != right
 
     def visit_logical_expr(self, expr):
@@ -331,35 +624,102 @@ class Interpreter:
     def visit_variable_expr(self, expr):
         return self.lookup_variable(expr.name, expr)
 
+    def visit_probe_expr(self, expr):
+        value = expr.expr.accept(self)
+        if value is None or value is False:
+            expr.falsy += 1
+        else:
+            expr.truthy += 1
+        return value
+
     def visit_assign_expr(self, expr):
         value = self.evaluate(expr.expr)
-        depth = self.locals.get(expr)
-        if depth is not None:
-            self.env.assign_at(depth, expr.name, value)
+        if expr.depth is not None:
+            self.env.assign_at(expr.depth, expr.slot, value)
+        elif expr.name.lexeme in self.globals:
+            self.globals[expr.name.lexeme] = value
         else:
-            self.env.assign(expr.name, value)
+            raise RunTimeError(expr.name, f"Undefined variable '{expr.name.lexeme}'.")
 
         return value
 
-    def visit_call_expr(self, expr):
-        callee = self.evaluate(expr.callee)
-        if not hasattr(callee, "call"):
+    def visit_call_expr(self, expr, tail=False):
+        # a tail call hands Lox functions back as a TailCall instead of
+        # running them, anything else is called right away
+        callee = expr.callee
+        if type(callee) is GetExpr:
+            obj = self.evaluate(callee.obj)
+            if isinstance(obj, LoxInstance) and field_offset(callee, obj) is None:
+                return self.invoke(obj, self.lookup_method(callee, obj), expr, tail)
+            callee = self.get_property(callee, obj)
+        elif type(callee) is SuperExpr:
+            this = self.env.get_at(callee.depth - 1, 0)
+            return self.invoke(this, self.super_method(callee), expr, tail)
+        else:
+            callee = self.evaluate(callee)
+
+        # plain functions are by far the most common callee, they skip the
+        # capability check and the arity call
+        is_function = type(callee) is self.function_type
+        if not is_function and not hasattr(callee, "call"):
             raise RunTimeError(expr.paren, "can only call functions.")
 
         args = [self.evaluate(arg) for arg in expr.args]
-        if len(args) != callee.arity():
+        if not is_function or len(args) != callee.param_count:
+            if len(args) != callee.arity():
+                raise RunTimeError(
+                    expr.paren,
+                    f"Expected {callee.arity()} arguments, {len(args)} provided.",
+                )
+        elif tail:
+            return TailCall(callee, args)
+
+        if self.depth == self.max_depth:
+            raise RunTimeError(expr.paren, "Stack overflow.")
+        try:
+            return callee.call(self, args)
+        except RecursionError:
+            raise RunTimeError(expr.paren, "Stack overflow.") from None
+
+    def invoke(self, receiver, method, expr, tail=False):
+        # calls a method without binding it first, `this` goes straight into
+        # the first slot of the method's frame
+        args = [receiver]
+        for arg in expr.args:
+            args.append(self.evaluate(arg))
+        if len(args) - 1 != method.param_count:
             raise RunTimeError(
                 expr.paren,
-                f"Expected {callee.arity()} arguments, {len(args)} provided.",
+                f"Expected {method.param_count} arguments, {len(args) - 1} provided.",
             )
-        return callee.call(self, args)
+        if tail:
+            return TailCall(method, args)
+
+        if self.depth == self.max_depth:
+            raise RunTimeError(expr.paren, "Stack overflow.")
+        try:
+            return method.call(self, args)
+        except RecursionError:
+            raise RunTimeError(expr.paren, "Stack overflow.") from None
 
     def visit_get_expr(self, expr):
-        obj = self.evaluate(expr.obj)
-        if isinstance(obj, LoxInstance):
-            return obj.get(expr.name)
+        return self.get_property(expr, self.evaluate(expr.obj))
+
+    def get_property(self, expr, obj):
+        if not isinstance(obj, LoxInstance):
+            raise RunTimeError(expr.name, "only instances can have properties.")
 
-        raise RunTimeError(expr.name, "only instances can have properties.")
+        offset = field_offset(expr, obj)
+        if offset is not None:  # fields shadow methods
+            return obj.values[offset]
+
+        return self.lookup_method(expr, obj).bind(obj)
+
+    def lookup_method(self, expr, obj):
+        method = find_method(expr, obj.cls)
+        if method is None:
+            raise RunTimeError(expr.name, f"Undefined property {expr.name.lexeme}.")
+        return method
 
     def visit_set_expr(self, expr):
         obj = self.evaluate(expr.obj)
@@ -367,21 +727,22 @@ class Interpreter:
             raise RunTimeError(expr.name, "only instances can set properties.")
 
         value = self.evaluate(expr.value)
-        obj.set(expr.name, value)
+        set_field(expr, obj, value)
         return value
 
     def visit_this_expr(self, expr):
         return self.lookup_variable(expr.keyword, expr)
 
     def visit_super_expr(self, expr):
-        distance = self.locals.get(expr)
-        supercls = self.env.get_at(distance, "super")
-        obj = self.env.get_at(distance - 1, "this")
+        this = self.env.get_at(expr.depth - 1, 0)
+        return self.super_method(expr).bind(this)
+
+    def super_method(self, expr):
+        supercls = self.env.get_at(expr.depth, 0)
         method = supercls.get_method(expr.method.lexeme)
         if not method:
-            raise RunTimeError(f"Undefined property {expr.method.lexeme}.")
-
-        return method.bind(obj)
+            raise RunTimeError(expr.method, f"Undefined property {expr.method.lexeme}.")
+        return method
 
     def is_truthy(self, value):
         # false and nil are falsey, and everything else is truthy.
@@ -403,14 +764,18 @@ class Interpreter:
         raise RunTimeError(op, "Operands must be numbers.")
 
     def stringify(self, value):
-        if value is None:
-            return "nil"
+        return stringify(value)
 
-        if isinstance(value, bool):
-            return str(value).lower()
 
-        value = str(value)
-        if value.endswith(".0"):
-            return value[:-2]
+def stringify(value):
+    if value is None:
+        return "nil"
 
-        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+
+    value = str(value)
+    if value.endswith(".0"):
+        return value[:-2]
+
+    return value
@@ -0,0 +1,193 @@
+"""
+Line and branch coverage of a Lox script.
+
+The resolved program is instrumented once before it runs: every statement is
+wrapped in a ProbeStmt counting how often it runs, and every condition that
+picks a branch in a ProbeExpr counting how often it was truthy and falsy.
+Those are the conditions of if and while statements, and the left operands
+of and and or, which decide whether the right one is evaluated. Nothing else
+is traced, so a covered run costs one more node per statement and condition.
+
+Only the tree-walking interpreter and the closure compiler run probes.
+"""
+
+import json
+import os
+import sys
+
+from expressions import Expr, LogicalExpr, ProbeExpr
+from statements import BlockStmt, FuncStmt, IfStmt, ProbeStmt, Stmt, WhileStmt
+from tokens import TokenType
+
+# what a branch point does when its condition is truthy, and when falsy
+OUTCOMES = {
+    "if": ("then", "else"),
+    "while": ("body", "exit"),
+    "and": ("right", "short-circuit"),
+    "or": ("short-circuit", "right"),
+}
+
+
+class Branch:
+    __slots__ = ("line", "kind", "probe")
+
+    def __init__(self, line, kind, probe):
+        self.line = line
+        self.kind = kind
+        self.probe = probe
+
+    def counts(self):
+        return self.probe.truthy, self.probe.falsy
+
+    def as_dict(self):
+        return {
+            "line": self.line,
+            "kind": self.kind,
+            **dict(zip(OUTCOMES[self.kind], self.counts())),
+        }
+
+
+class Coverage:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.probes = []  # ProbeStmt
+        self.branches = []  # Branch
+
+    # instrumenting
+    def instrument(self, stmts):
+        # returns the program to run, the nodes of stmts change in place
+        program = self.probe_all(stmts)
+        nodes = list(stmts)
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(children(node))
+
+            if type(node) is BlockStmt:
+                node.stmts = tuple(self.probe_all(node.stmts))
+            elif type(node) is FuncStmt:
+                node.body = tuple(self.probe_all(node.body))
+            elif type(node) is IfStmt:
+                node.condition = self.branch(node.line, "if", node.condition)
+                node.then = self.probe(node.then)
+                if node.otherwise:
+                    node.otherwise = self.probe(node.otherwise)
+            elif type(node) is WhileStmt:
+                node.condition = self.branch(node.line, "while", node.condition)
+                node.stmt = self.probe(node.stmt)
+            elif type(node) is LogicalExpr:
+                kind = "or" if node.op.type == TokenType.OR else "and"
+                node.left = self.branch(node.op.line, kind, node.left)
+
+        self.branches.sort(key=lambda branch: branch.line)
+        return program
+
+    def probe(self, stmt):
+        probe = ProbeStmt(stmt)
+        probe.line = stmt.line
+        self.probes.append(probe)
+        return probe
+
+    def probe_all(self, stmts):
+        return [self.probe(stmt) for stmt in stmts]
+
+    def branch(self, line, kind, expr):
+        probe = ProbeExpr(expr)
+        self.branches.append(Branch(line, kind, probe))
+        return probe
+
+    # results
+    def lines(self):
+        # line -> how often its statements ran, the most often run one counts
+        lines = {}
+        for probe in self.probes:
+            lines[probe.line] = max(lines.get(probe.line, 0), probe.hits)
+        return dict(sorted(lines.items()))
+
+    def summary(self):
+        lines = self.lines()
+        outcomes = [count for branch in self.branches for count in branch.counts()]
+        return {
+            "lines": len(lines),
+            "lines_hit": sum(1 for count in lines.values() if count),
+            "branches": len(outcomes),
+            "branches_hit": sum(1 for count in outcomes if count),
+        }
+
+    def as_dict(self):
+        return {
+            "file": self.path,
+            "summary": self.summary(),
+            "lines": {str(line): count for line, count in self.lines().items()},
+            "branches": [branch.as_dict() for branch in self.branches],
+        }
+
+    def lcov(self):
+        summary = self.summary()
+        records = ["TN:", f"SF:{self.path}"]
+        for block, branch in enumerate(self.branches):
+            counts = branch.counts()
+            for outcome, count in enumerate(counts):
+                # "-" marks a branch point that was never reached
+                taken = count if any(counts) else "-"
+                records.append(f"BRDA:{branch.line},{block},{outcome},{taken}")
+        records.append(f"BRF:{summary['branches']}")
+        records.append(f"BRH:{summary['branches_hit']}")
+        for line, count in self.lines().items():
+            records.append(f"DA:{line},{count}")
+        records.append(f"LF:{summary['lines']}")
+        records.append(f"LH:{summary['lines_hit']}")
+        records.append("end_of_record")
+        return "\n".join(records) + "\n"
+
+    def report(self, file=sys.stderr):
+        summary = self.summary()
+        print(
+            f"coverage: {summary['lines_hit']} of {summary['lines']} lines "
+            f"({percent(summary['lines_hit'], summary['lines'])}), "
+            f"{summary['branches_hit']} of {summary['branches']} branches "
+            f"({percent(summary['branches_hit'], summary['branches'])})",
+            file=file,
+        )
+
+        missed = [line for line, count in self.lines().items() if not count]
+        if missed:
+            print(f"lines not run: {ranges(missed)}", file=file)
+        for branch in self.branches:
+            for outcome, count in zip(OUTCOMES[branch.kind], branch.counts()):
+                if not count:
+                    print(
+                        f"line {branch.line}: {branch.kind} never took {outcome}",
+                        file=file,
+                    )
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def dump_lcov(self, path):
+        with open(path, "w") as f:
+            f.write(self.lcov())
+
+
+def children(node):
+    for slot in type(node).__slots__:
+        field = getattr(node, slot)
+        if isinstance(field, (Expr, Stmt)):
+            yield field
+        elif type(field) is tuple or type(field) is list:
+            yield from (item for item in field if isinstance(item, (Expr, Stmt)))
+
+
+def percent(part, whole):
+    return f"{part / whole:.1%}" if whole else "100%"
+
+
+def ranges(lines):
+    # [1, 2, 3, 7] -> "1-3, 7"
+    spans = []
+    for line in lines:
+        if spans and spans[-1][1] == line - 1:
+            spans[-1][1] = line
+        else:
+            spans.append([line, line])
+    return ", ".join(f"{a}-{b}" if a != b else f"{a}" for a, b in spans)
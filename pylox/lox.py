@@ -24,6 +24,29 @@ class Lox:
         print(f"[line {error.token.line}] {error.args[0]}")
         Lox.had_runtime_error = True
 
+    @staticmethod
+    def nesting_error(stmts):
+        # a pass ran past the recursion limit: blames the statement nested
+        # the deepest, found without recursing itself
+        from expressions import Expr
+        from statements import Stmt
+
+        line, deepest = 0, -1
+        stack = [(stmt, 0) for stmt in stmts]
+        while stack:
+            node, depth = stack.pop()
+            if isinstance(node, Stmt) and depth > deepest:
+                line, deepest = node.line, depth
+            for slot in type(node).__slots__:
+                field = getattr(node, slot, None)
+                if type(field) is not tuple and type(field) is not list:
+                    field = (field,)
+                for child in field:
+                    if isinstance(child, (Expr, Stmt)):
+                        stack.append((child, depth + 1))
+
+        Lox.report(line, "", "Too much nesting.")
+
     @staticmethod
     def report(line, where, msg):
         print(f"[line {line}] Error: {where}: {msg}", file=sys.stderr)
@@ -1,41 +1,296 @@
-import sys
+import argparse
 from lox import Lox
 
-if __name__ == "__main__":
-    args = sys.argv
-    if len(args) > 2:
-        print("Usage: ./lox [script]")
-        sys.exit(64)
 
-    from scanner import Scanner
-    from parser import Parser, ParseError
-    from interpreter import Interpreter
+def front_end(data, interpreter, optimize=True, scanner="regex"):
+    # returns the program ready to run, or None if it has static errors
+    from scanner import Scanner, RegexScanner
+    from parser import Parser, BufferParser
+    from resolver import Resolver
+    from optimizer import Optimizer
+
+    if scanner == "regex":
+        statements = BufferParser(RegexScanner(data).scan_buffer()).parse()
+    else:
+        statements = Parser(Scanner(data).scan_tokens()).parse()
+    if Lox.had_error:
+        return None
+
+    Resolver(interpreter).resolve(statements)
+    if Lox.had_error:
+        return None
+
+    if optimize:
+        statements = Optimizer().optimize(statements)
+        if Lox.had_error:
+            return None
+    return statements
+
+
+def load_program(path, data, interpreter, backend, optimize=True, scanner="regex"):
+    # the resolved program of an unchanged script comes from the cache
+    from ast_cache import AstCache
+
+    cache = AstCache(path, backend, optimize)
+    statements = cache.load(data)
+    if statements is None:
+        statements = front_end(data, interpreter, optimize, scanner)
+        if statements is not None:
+            cache.store(data, statements)
+    return statements
+
+
+def run_transpiled(path, data, optimize=True, scanner="regex"):
+    from transpiler import CodeCache
+
+    interpreter = make_interpreter("python")
+    cache = CodeCache(path, optimize)
+    code = cache.load(data)
+    if code is None:
+        statements = front_end(data, interpreter, optimize, scanner)
+        if statements is None:
+            return
+
+        code = interpreter.compile(statements, path)
+        if code is None:
+            return
+        cache.store(data, code)
+
+    interpreter.run(code)
+
+
+def run_streaming(path, backend, optimize=True, max_depth=None):
+    # every top level declaration runs as soon as it is parsed, so neither the
+    # source nor its tokens or syntax tree are ever in memory all at once
+    from scanner import StreamingScanner
+    from parser import StreamingParser
     from resolver import Resolver
+    from optimizer import Optimizer
+
+    interpreter = make_interpreter(backend, max_depth)
+    resolver = Resolver(interpreter)
+    parser = StreamingParser(StreamingScanner(path).tokens())
+    for stmt in parser.declarations():
+        if Lox.had_runtime_error:
+            return
+        if Lox.had_error:
+            continue  # keep going to report the rest of the syntax errors
 
-    if len(args) == 2:
-        filename = args[1]
-        with open(filename, "r") as f:
+        resolver.resolve(stmt)
+        if Lox.had_error:
+            continue
+
+        statements = [stmt]
+        if optimize:
+            statements = Optimizer().optimize(statements)
+            if Lox.had_error:
+                continue
+        interpreter.interpret(statements)
+
+
+def make_interpreter(
+    backend, max_depth=None, profile=False, sample=None, memstats=None
+):
+    if memstats is not None:
+        from memstats import MemStatsInterpreter
+
+        return MemStatsInterpreter(max_depth, memstats)
+    if sample is not None:
+        from profiler import SamplingInterpreter
+
+        return SamplingInterpreter(max_depth, sample)
+    if profile:
+        from profiler import ProfilingInterpreter
+
+        return ProfilingInterpreter(max_depth)
+    if backend == "closure":
+        from closure_compiler import ClosureInterpreter
+
+        return ClosureInterpreter(max_depth)
+    if backend == "vm":
+        from vm import VM
+
+        return VM(max_depth)
+    if backend == "python":
+        from transpiler import PythonInterpreter
+
+        return PythonInterpreter()
+
+    from interpreter import Interpreter
+
+    return Interpreter(max_depth)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(prog="lox")
+    argparser.add_argument("script", nargs="?")
+    argparser.add_argument(
+        "--backend",
+        choices=["tree", "closure", "vm", "python"],
+        default="tree",
+        help="execution engine (default: tree-walking interpreter)",
+    )
+    argparser.add_argument(
+        "--no-optimize",
+        dest="optimize",
+        action="store_false",
+        help="run the program without constant folding and dead code removal",
+    )
+    argparser.add_argument(
+        "--scanner",
+        choices=["regex", "classic"],
+        default="regex",
+        help="tokenizer (default: one compiled regex, classic: char by char)",
+    )
+    argparser.add_argument(
+        "--stream",
+        action="store_true",
+        help="run each top level declaration of the script as soon as it is parsed",
+    )
+    argparser.add_argument(
+        "--max-depth",
+        type=int,
+        help="how deeply Lox calls may nest before a stack overflow error "
+        "(default: 100000, the python backend stops at python's recursion limit)",
+    )
+    argparser.add_argument(
+        "--profile",
+        action="store_true",
+        help="report the calls and time of every function and the runs of "
+        "every line when the script is done (tree backend only)",
+    )
+    argparser.add_argument(
+        "--profile-json",
+        metavar="FILE",
+        help="also write the profile to FILE as JSON, implies --profile",
+    )
+    argparser.add_argument(
+        "--sample",
+        metavar="FILE",
+        help="sample the running Lox calls and write them to FILE as folded "
+        "stacks for flame graphs (tree backend only)",
+    )
+    argparser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=1.0,
+        metavar="MS",
+        help="milliseconds of cpu time between samples, the system may round "
+        "it up to its timer tick (default: 1)",
+    )
+    argparser.add_argument(
+        "--coverage",
+        action="store_true",
+        help="report the lines and branches of the script that ran, implies "
+        "--no-optimize (tree and closure backends only)",
+    )
+    argparser.add_argument(
+        "--coverage-lcov",
+        metavar="FILE",
+        help="also write the coverage to FILE in LCOV format, implies --coverage",
+    )
+    argparser.add_argument(
+        "--coverage-json",
+        metavar="FILE",
+        help="also write the coverage to FILE as JSON, implies --coverage",
+    )
+    argparser.add_argument(
+        "--memstats",
+        action="store_true",
+        help="report the environments, instances, bound methods and strings "
+        "the script made, per function and line (tree backend only)",
+    )
+    argparser.add_argument(
+        "--memstats-json",
+        metavar="FILE",
+        help="also write the memory stats to FILE as JSON, implies --memstats",
+    )
+    argparser.add_argument(
+        "--memstats-tracemalloc",
+        action="store_true",
+        help="also trace every python allocation with tracemalloc, which is "
+        "much slower, implies --memstats",
+    )
+    args = argparser.parse_args()
+    args.profile = args.profile or args.profile_json is not None
+    if args.profile and (args.backend != "tree" or args.stream or not args.script):
+        argparser.error("--profile needs a script run by the tree backend")
+    if args.sample and (args.backend != "tree" or args.stream or not args.script):
+        argparser.error("--sample needs a script run by the tree backend")
+    if args.sample and args.profile:
+        argparser.error("--sample and --profile can't be used together")
+    if args.sample_interval <= 0:
+        argparser.error("--sample-interval must be positive")
+    sample = args.sample_interval / 1000 if args.sample else None
+    args.memstats = (
+        args.memstats or args.memstats_tracemalloc or args.memstats_json is not None
+    )
+    if args.memstats and (args.backend != "tree" or args.stream or not args.script):
+        argparser.error("--memstats needs a script run by the tree backend")
+    if args.memstats and (args.sample or args.profile):
+        argparser.error("--memstats can't be used with --sample or --profile")
+    memstats = args.memstats_tracemalloc if args.memstats else None
+    args.coverage = args.coverage or bool(args.coverage_lcov or args.coverage_json)
+    if args.coverage and (
+        args.backend not in ("tree", "closure") or args.stream or not args.script
+    ):
+        argparser.error("--coverage needs a script run by the tree or closure backend")
+    if args.coverage:
+        # code the optimizer would drop still has to show up as not run
+        args.optimize = False
+
+    if args.stream and args.script:
+        run_streaming(args.script, args.backend, args.optimize, args.max_depth)
+    elif args.script:
+        with open(args.script, "r") as f:
             data = f.read()
 
-        tokens = Scanner(data).scan_tokens()
-        statements = Parser(tokens).parse()
-        if not Lox.had_error:
-            interpreter = Interpreter()
-            Resolver(interpreter).resolve(statements)
-            if not Lox.had_error:
+        if args.backend == "python":
+            run_transpiled(args.script, data, args.optimize, args.scanner)
+        else:
+            interpreter = make_interpreter(
+                args.backend, args.max_depth, args.profile, sample, memstats
+            )
+            statements = load_program(
+                args.script,
+                data,
+                interpreter,
+                args.backend,
+                args.optimize,
+                args.scanner,
+            )
+            if statements is not None and args.coverage:
+                from line_coverage import Coverage
+
+                coverage = Coverage(args.script)
+                statements = coverage.instrument(statements)
+            if statements is not None:
                 interpreter.interpret(statements)
+                if args.coverage:
+                    coverage.report()
+                if args.coverage_lcov:
+                    coverage.dump_lcov(args.coverage_lcov)
+                if args.coverage_json:
+                    coverage.dump_json(args.coverage_json)
+                if args.profile:
+                    interpreter.report()
+                if args.profile_json:
+                    interpreter.dump(args.profile_json)
+                if args.sample:
+                    interpreter.dump(args.sample)
+                if args.memstats:
+                    interpreter.report()
+                if args.memstats_json:
+                    interpreter.dump(args.memstats_json)
     else:
         print("Lox 0.1.0")
-        interpreter = Interpreter()
+        interpreter = make_interpreter(args.backend, args.max_depth)
         try:
             while True:
                 line = input("> ")
-                tokens = Scanner(line).scan_tokens()
-                statements = Parser(tokens).parse()
-                if not Lox.had_error:
-                    Resolver(interpreter).resolve(statements)
-                    if not Lox.had_error:
-                        interpreter.interpret(statements)
+                statements = front_end(line, interpreter, args.optimize, args.scanner)
+                if statements is not None:
+                    interpreter.interpret(statements)
 
                 Lox.had_error = False
         except EOFError:
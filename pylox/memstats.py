@@ -0,0 +1,300 @@
+"""
+Counts the runtime objects a Lox script allocates, and where it does.
+
+Every environment (one per call and one per block run), instance, bound
+method and string made by + is counted against the Lox function and line
+that made it, with its size in bytes when it was made. A call's environment
+counts against the line its function is declared on.
+
+Environments, instances and bound methods are made of subclasses that weak
+references can point to, which tell when each of them dies. That gives how
+many are live, and the most that were live at once. Strings can't be weakly
+referenced, so only how many were made and their sizes are known.
+
+With tracemalloc on, the report also shows the peak of all the memory python
+allocated during the run, and which lines of the interpreter itself hold the
+memory the run left allocated.
+"""
+
+import json
+import sys
+import tracemalloc
+import weakref
+
+from environment import Environment
+from interpreter import (
+    BoundMethod,
+    LoxClass,
+    LoxInstance,
+    TailCall,
+    field_offset,
+)
+from profiler import ShadowedFunction, ShadowStackInterpreter
+
+ENVIRONMENT = "environment"
+INSTANCE = "instance"
+BOUND_METHOD = "bound method"
+STRING = "string"
+KINDS = (ENVIRONMENT, INSTANCE, BOUND_METHOD, STRING)
+
+
+class TrackedEnvironment(Environment):
+    __slots__ = ("__weakref__",)
+
+
+class TrackedInstance(LoxInstance):
+    __slots__ = ("__weakref__",)
+
+
+class TrackedBoundMethod(BoundMethod):
+    __slots__ = ("__weakref__",)
+
+
+class AllocationStats:
+    __slots__ = ("count", "bytes", "live", "live_bytes", "peak", "peak_bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.live = 0
+        self.live_bytes = 0
+        self.peak = 0  # the most live at once
+        self.peak_bytes = 0
+
+    def allocated(self, size):
+        self.count += 1
+        self.bytes += size
+        self.live += 1
+        self.live_bytes += size
+        if self.live > self.peak:
+            self.peak = self.live
+        if self.live_bytes > self.peak_bytes:
+            self.peak_bytes = self.live_bytes
+
+    def freed(self, size):
+        self.live -= 1
+        self.live_bytes -= size
+
+    def as_dict(self, tracked=True):
+        stats = {"count": self.count, "bytes": self.bytes}
+        if tracked:
+            stats.update(
+                live=self.live,
+                peak=self.peak,
+                peak_bytes=self.peak_bytes,
+            )
+        return stats
+
+
+class MemStatsFunction(ShadowedFunction):
+    def call(self, interpreter, args):
+        # ShadowedFunction.call, making the frames environments it tracks
+        function = self
+        shadow = interpreter.shadow
+        frame = interpreter.frame = [function.stmt, function.stmt.name.line]
+        shadow.append(frame)
+        interpreter.depth += 1
+        try:
+            while True:
+                env = TrackedEnvironment(function.closure, args)
+                interpreter.track(ENVIRONMENT, env)
+                result = interpreter.execute_block(function.stmt.body, env)
+                if type(result) is not TailCall:
+                    break
+                function, args = result.function, result.args
+                frame[0], frame[1] = function.stmt, function.stmt.name.line
+        finally:
+            interpreter.depth -= 1
+            shadow.pop()
+            interpreter.frame = shadow[-1]
+
+        if function.init:
+            return args[0]
+        if result is not None:
+            return result[0]
+
+
+class MemStatsClass(LoxClass):
+    def call(self, interpreter, args):
+        instance = TrackedInstance(self)
+        interpreter.track(INSTANCE, instance)
+        if self.initializer:
+            self.initializer.call(interpreter, [instance, *args])
+
+        return instance
+
+
+class MemStatsInterpreter(ShadowStackInterpreter):
+    """
+    The tree-walking interpreter, counting the objects the script makes per
+    kind and per site: a kind, a function (None for the script itself) and
+    a line.
+    """
+
+    def __init__(self, max_depth=None, trace=False):
+        super().__init__(max_depth)
+        self.function_type = MemStatsFunction
+        self.class_type = MemStatsClass
+        self.kinds = {kind: AllocationStats() for kind in KINDS}
+        self.sites = {}  # (kind, FuncStmt, line) -> AllocationStats
+        self.refs = {}  # weak reference -> (site stats, kind stats, size)
+        self.trace = trace
+        self.traced = None  # (peak bytes, memory left allocated by line)
+
+    def interpret(self, statements):
+        if not self.trace:
+            return super().interpret(statements)
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            super().interpret(statements)
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # leaving out tracemalloc's own memory and the counting's
+        ours = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        growth = after.filter_traces(ours).compare_to(
+            before.filter_traces(ours), "lineno"
+        )
+        self.traced = (peak, [stat for stat in growth if stat.size_diff > 0])
+
+    # counting
+    def track(self, kind, obj):
+        size = sys.getsizeof(obj)
+        if kind is ENVIRONMENT or kind is INSTANCE:
+            size += sys.getsizeof(obj.values)
+
+        function, line = self.frame
+        site = self.sites.get((kind, function, line))
+        if site is None:
+            site = self.sites[(kind, function, line)] = AllocationStats()
+        stats = self.kinds[kind]
+        site.allocated(size)
+        stats.allocated(size)
+        if kind is not STRING:
+            self.refs[weakref.ref(obj, self.freed)] = (site, stats, size)
+
+    def freed(self, ref):
+        site, stats, size = self.refs.pop(ref)
+        site.freed(size)
+        stats.freed(size)
+
+    def visit_block_stmt(self, stmt):
+        env = TrackedEnvironment(self.env)
+        self.track(ENVIRONMENT, env)
+        return self.execute_block(stmt.stmts, env)
+
+    def visit_binary_expr(self, expr):
+        value = super().visit_binary_expr(expr)
+        if type(value) is str:  # only + makes strings
+            self.track(STRING, value)
+        return value
+
+    def get_property(self, expr, obj):
+        if not isinstance(obj, LoxInstance) or field_offset(expr, obj) is not None:
+            return super().get_property(expr, obj)
+
+        method = TrackedBoundMethod(self.lookup_method(expr, obj), obj)
+        self.track(BOUND_METHOD, method)
+        return method
+
+    def visit_super_expr(self, expr):
+        this = self.env.get_at(expr.depth - 1, 0)
+        method = TrackedBoundMethod(self.super_method(expr), this)
+        self.track(BOUND_METHOD, method)
+        return method
+
+    # reports
+    def as_dict(self):
+        sites = sorted(
+            self.sites.items(), key=lambda item: (-item[1].bytes, item[0][0])
+        )
+        stats = {
+            "kinds": {
+                kind: stats.as_dict(kind is not STRING)
+                for kind, stats in self.kinds.items()
+            },
+            "sites": [
+                {
+                    "kind": kind,
+                    "function": None if stmt is None else self.function_name(stmt),
+                    "line": line,
+                    **site.as_dict(kind is not STRING),
+                }
+                for (kind, stmt, line), site in sites
+            ],
+        }
+        if self.traced is not None:
+            peak, growth = self.traced
+            stats["tracemalloc"] = {
+                "peak": peak,
+                "retained": [
+                    {
+                        "file": stat.traceback[0].filename,
+                        "line": stat.traceback[0].lineno,
+                        "bytes": stat.size_diff,
+                        "blocks": stat.count_diff,
+                    }
+                    for stat in growth
+                ],
+            }
+        return stats
+
+    def report(self, file=sys.stderr, max_sites=20):
+        stats = self.as_dict()
+        kinds = stats["kinds"]
+        print(
+            f"memstats: {sum(kind['count'] for kind in kinds.values()):,} objects "
+            f"made, {sum(kind['bytes'] for kind in kinds.values()):,} bytes",
+            file=file,
+        )
+        print(
+            f"{'kind':<13} {'made':>11} {'bytes':>13} {'peak live':>11} "
+            f"{'peak bytes':>13} {'live at end':>11}",
+            file=file,
+        )
+        for kind, entry in kinds.items():
+            print(
+                f"{kind:<13} {entry['count']:>11,} {entry['bytes']:>13,} "
+                f"{number(entry, 'peak'):>11} {number(entry, 'peak_bytes'):>13} "
+                f"{number(entry, 'live'):>11}",
+                file=file,
+            )
+
+        print(
+            f"\n{'made':>11} {'bytes':>13} {'peak live':>11}  {'kind':<13} site",
+            file=file,
+        )
+        for site in stats["sites"][:max_sites]:
+            name = f"{site['function'] or '<script>'} (line {site['line']})"
+            print(
+                f"{site['count']:>11,} {site['bytes']:>13,} "
+                f"{number(site, 'peak'):>11}  {site['kind']:<13} {name}",
+                file=file,
+            )
+        if len(stats["sites"]) > max_sites:
+            print(f"{'...':>11} {len(stats['sites']) - max_sites} more", file=file)
+
+        if "tracemalloc" in stats:
+            traced = stats["tracemalloc"]
+            print(f"\ntracemalloc: peak {traced['peak']:,} bytes", file=file)
+            for entry in traced["retained"][:max_sites]:
+                print(
+                    f"{entry['bytes']:>13,} bytes left in {entry['blocks']:,} "
+                    f"blocks by {entry['file']}:{entry['line']}",
+                    file=file,
+                )
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def number(stats, key):
+    # strings have no live counts
+    return f"{stats[key]:,}" if key in stats else "-"
@@ -0,0 +1,208 @@
+import operator
+from lox import Lox
+from tokens import TokenType
+from expressions import *
+from statements import *
+
+FOLDABLE_OPS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.SLASH: operator.truediv,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+    TokenType.EQUAL_EQUAL: operator.eq,
+    TokenType.BANG_EQUAL: operator.ne,
+}
+
+
+def is_truthy(value):
+    return value is not None and value is not False
+
+
+def can_fold(op, left, right):
+    # anything that would raise a RunTimeError is left alone, so the error
+    # is still reported when (and if) that code runs, at its own line
+    if op in (TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL):
+        return True
+    if op == TokenType.PLUS and type(left) is type(right) is str:
+        return True
+    if type(left) is not float or type(right) is not float:
+        return False
+    return op != TokenType.SLASH or right != 0
+
+
+class Optimizer:
+    """
+    Rewrites a resolved program: folds operators over literals, drops
+    groupings, prunes branches and loops whose condition is a constant and
+    statements after a `return`.
+
+    It runs after the Resolver, so the variable, assignment, `this` and
+    `super` nodes the backends look up are kept as they are, only the nodes
+    around them are replaced.
+    """
+
+    def optimize(self, stmts):
+        try:
+            return self.optimize_stmts(stmts)
+        except RecursionError:
+            Lox.nesting_error(stmts)
+            return stmts
+
+    def optimize_stmts(self, stmts):
+        result = []
+        for stmt in stmts:
+            stmt = stmt.accept(self)
+            if stmt is None:
+                continue
+
+            result.append(stmt)
+            if isinstance(stmt, ReturnStmt):
+                break  # the rest can never run
+
+        return result
+
+    def optimize_branch(self, stmt):
+        # a branch can't just disappear from an if or a while
+        optimized = stmt.accept(self)
+        if optimized is None:
+            optimized = BlockStmt([])
+            optimized.line = stmt.line
+        return optimized
+
+    # statements
+    def visit_print_stmt(self, stmt):
+        stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    def visit_assert_stmt(self, stmt):
+        stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    def visit_expr_stmt(self, stmt):
+        stmt.expr = stmt.expr.accept(self)
+        if isinstance(stmt.expr, LiteralExpr):
+            return None
+        return stmt
+
+    def visit_var_stmt(self, stmt):
+        if stmt.expr:
+            stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    def visit_block_stmt(self, stmt):
+        stmt.stmts = tuple(self.optimize_stmts(stmt.stmts))
+        if not stmt.stmts:
+            return None
+        return stmt
+
+    def visit_if_statement(self, stmt):
+        stmt.condition = stmt.condition.accept(self)
+        if isinstance(stmt.condition, LiteralExpr):
+            if is_truthy(stmt.condition.value):
+                return stmt.then.accept(self)
+            if stmt.otherwise:
+                return stmt.otherwise.accept(self)
+            return None
+
+        stmt.then = self.optimize_branch(stmt.then)
+        if stmt.otherwise:
+            stmt.otherwise = stmt.otherwise.accept(self)
+        return stmt
+
+    def visit_while_statement(self, stmt):
+        stmt.condition = stmt.condition.accept(self)
+        if isinstance(stmt.condition, LiteralExpr):
+            if not is_truthy(stmt.condition.value):
+                return None
+            # every backend tests a literal `true` the cheapest way it can
+            stmt.condition = LiteralExpr(True)
+
+        stmt.stmt = self.optimize_branch(stmt.stmt)
+        return stmt
+
+    def visit_func_statement(self, stmt):
+        stmt.body = tuple(self.optimize_stmts(stmt.body))
+        return stmt
+
+    def visit_class_statement(self, stmt):
+        for method in stmt.methods:
+            method.accept(self)
+        return stmt
+
+    def visit_return_statement(self, stmt):
+        if stmt.expr:
+            stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    # expressions
+    def visit_literal_expr(self, expr):
+        return expr
+
+    def visit_grouping_expr(self, expr):
+        return expr.expr.accept(self)
+
+    def visit_unary_expr(self, expr):
+        expr.right = expr.right.accept(self)
+        if not isinstance(expr.right, LiteralExpr):
+            return expr
+
+        value = expr.right.value
+        if expr.op.type == TokenType.BANG:
+            return LiteralExpr(not is_truthy(value))
+        if type(value) is float:
+            return LiteralExpr(-value)
+        return expr
+
+    def visit_binary_expr(self, expr):
+        expr.left = expr.left.accept(self)
+        expr.right = expr.right.accept(self)
+        if not isinstance(expr.left, LiteralExpr) or not isinstance(
+            expr.right, LiteralExpr
+        ):
+            return expr
+
+        op, left, right = expr.op.type, expr.left.value, expr.right.value
+        if can_fold(op, left, right):
+            return LiteralExpr(FOLDABLE_OPS[op](left, right))
+        return expr
+
+    def visit_logical_expr(self, expr):
+        expr.left = expr.left.accept(self)
+        expr.right = expr.right.accept(self)
+        if not isinstance(expr.left, LiteralExpr):
+            return expr
+
+        if is_truthy(expr.left.value) == (expr.op.type == TokenType.OR):
+            return expr.left
+        return expr.right
+
+    def visit_variable_expr(self, expr):
+        return expr
+
+    def visit_assign_expr(self, expr):
+        expr.expr = expr.expr.accept(self)
+        return expr
+
+    def visit_call_expr(self, expr):
+        expr.callee = expr.callee.accept(self)
+        expr.args = tuple([arg.accept(self) for arg in expr.args])
+        return expr
+
+    def visit_get_expr(self, expr):
+        expr.obj = expr.obj.accept(self)
+        return expr
+
+    def visit_set_expr(self, expr):
+        expr.obj = expr.obj.accept(self)
+        expr.value = expr.value.accept(self)
+        return expr
+
+    def visit_this_expr(self, expr):
+        return expr
+
+    def visit_super_expr(self, expr):
+        return expr
@@ -62,6 +62,26 @@ from expressions import *
 from statements import *
 from lox import Lox
 
+EOF_CODE = TokenType.EOF._value_
+
+# How tightly each binary operator binds, loosest first. The expression
+# rules of the grammar above are parsed by precedence climbing over this.
+PRECEDENCE = {
+    TokenType.OR: 1,
+    TokenType.AND: 2,
+    TokenType.BANG_EQUAL: 3,
+    TokenType.EQUAL_EQUAL: 3,
+    TokenType.GREATER: 4,
+    TokenType.GREATER_EQUAL: 4,
+    TokenType.LESS: 4,
+    TokenType.LESS_EQUAL: 4,
+    TokenType.MINUS: 5,
+    TokenType.PLUS: 5,
+    TokenType.SLASH: 6,
+    TokenType.STAR: 6,
+}
+CODE_PRECEDENCE = {type._value_: precedence for type, precedence in PRECEDENCE.items()}
+
 
 class ParseError(Exception):
     pass
@@ -74,24 +94,34 @@ class Parser:
 
     def parse(self):
         statements = []
-        while not self.at_end():
-            statements.append(self.declaration())
+        try:
+            while not self.at_end():
+                statements.append(self.declaration())
+        except RecursionError:
+            # whatever follows would be parsed at the wrong depth, so stop
+            self.error(self.peek(), "Too much nesting.")
 
         return statements
 
     def declaration(self):
         try:
+            line = self.current_line()
             if self.match(TokenType.VAR):
-                return self.var_declaration()
+                return self.located(self.var_declaration(), line)
             if self.match(TokenType.FUN):
-                return self.func_declaration()
+                return self.located(self.func_declaration(), line)
             if self.match(TokenType.CLASS):
-                return self.class_declaration()
+                return self.located(self.class_declaration(), line)
 
             return self.statement()
         except ParseError:
             self.synchronize()
 
+    def located(self, stmt, line):
+        # every statement knows the line it starts on, for the profilers
+        stmt.line = line
+        return stmt
+
     def var_declaration(self):
         name = self.consume(TokenType.IDENTIFIER, "Expect variable name.")
         expr = None
@@ -131,28 +161,32 @@ class Parser:
         self.consume(TokenType.LEFT_BRACE, "Expect '{' after class name.")
         funcs = []
         while not self.check(TokenType.RIGHT_BRACE) and not self.at_end():
-            funcs.append(self.func_declaration())
+            line = self.current_line()
+            funcs.append(self.located(self.func_declaration(), line))
         self.consume(TokenType.RIGHT_BRACE, "Expect '}' after class body.")
 
         return ClassStmt(name, supercls, funcs)
 
     def statement(self):
+        line = self.current_line()
         if self.match(TokenType.PRINT):
-            return self.print_statement()
-        if self.match(TokenType.ASSERT):
-            return self.assert_statement()
-        if self.match(TokenType.LEFT_BRACE):
-            return BlockStmt(self.block())
-        if self.match(TokenType.IF):
-            return self.if_statement()
-        if self.match(TokenType.WHILE):
-            return self.while_statement()
-        if self.match(TokenType.FOR):
-            return self.for_statement()
-        if self.match(TokenType.RETURN):
-            return self.return_statement()
-
-        return self.expression_statement()
+            stmt = self.print_statement()
+        elif self.match(TokenType.ASSERT):
+            stmt = self.assert_statement()
+        elif self.match(TokenType.LEFT_BRACE):
+            stmt = BlockStmt(self.block())
+        elif self.match(TokenType.IF):
+            stmt = self.if_statement()
+        elif self.match(TokenType.WHILE):
+            stmt = self.while_statement()
+        elif self.match(TokenType.FOR):
+            stmt = self.for_statement(line)
+        elif self.match(TokenType.RETURN):
+            stmt = self.return_statement()
+        else:
+            stmt = self.expression_statement()
+
+        return self.located(stmt, line)
 
     def print_statement(self):
         expr = self.expression()
@@ -193,15 +227,15 @@ class Parser:
         stmt = self.statement()
         return WhileStmt(condition, stmt)
 
-    def for_statement(self):
+    def for_statement(self, line):
         self.consume(TokenType.LEFT_PAREN, "Expect '(' after 'for'.")
         init = None
         if self.match(TokenType.SEMICOLON):  # match also consumes if true
             pass
         elif self.match(TokenType.VAR):
-            init = self.var_declaration()
+            init = self.located(self.var_declaration(), line)
         else:
-            self.expression_statement()
+            init = self.located(self.expression_statement(), line)
 
         condition = None if self.check(TokenType.SEMICOLON) else self.expression()
         self.consume(TokenType.SEMICOLON, "Expect ';' after loop condition")
@@ -214,11 +248,12 @@ class Parser:
         # we are going to transform this `for` loop into a `while` loop
         # increment happens at the end
         if increment:
-            body = BlockStmt([body, increment])
+            increment = self.located(ExpressionStmt(increment), line)
+            body = self.located(BlockStmt([body, increment]), line)
         if not condition:
             condition = LiteralExpr(True)
 
-        body = WhileStmt(condition, body)
+        body = self.located(WhileStmt(condition, body), line)
         if init:
             body = BlockStmt([init, body])  # new scope
         return body
@@ -238,7 +273,7 @@ class Parser:
         return self.assignment()
 
     def assignment(self):
-        expr = self.logic_or()
+        expr = self.binary(PRECEDENCE[TokenType.OR])
         if self.match(TokenType.EQUAL):
             equals = self.previous()
             right = self.assignment()  # right associative
@@ -251,70 +286,41 @@ class Parser:
 
         return expr
 
-    def logic_or(self):
-        expr = self.logic_and()
-        while self.match(TokenType.OR):
-            op = self.previous()
-            right = self.logic_and()
-            expr = LogicalExpr(expr, op, right)
-        return expr
-
-    def logic_and(self):
-        expr = self.equality()
-        while self.match(TokenType.AND):
-            op = self.previous()
-            right = self.equality()
-            expr = LogicalExpr(expr, op, right)
-        return expr
-
-    def equality(self):
-        expr = self.comparison()
-        while self.match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            op = self.previous()
-            right = self.comparison()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
-
-    def comparison(self):
-        expr = self.term()
-        while self.match(
-            TokenType.LESS,
-            TokenType.LESS_EQUAL,
-            TokenType.GREATER,
-            TokenType.GREATER_EQUAL,
-        ):
-            op = self.previous()
-            right = self.term()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
+    def binary(self, min_precedence):
+        # precedence climbing: a long chain of operators is parsed by the
+        # loop, only an operator that binds tighter than the one before it
+        # takes another call
+        expr = self.unary()
+        while True:
+            precedence = self.precedence()
+            if precedence < min_precedence:
+                return expr
 
-    def term(self):
-        expr = self.factor()
-        while self.match(TokenType.MINUS, TokenType.PLUS):
+            self.advance()
             op = self.previous()
-            right = self.factor()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
+            if precedence == PRECEDENCE[TokenType.STAR]:
+                right = self.binary(precedence)  # right associative
+            else:
+                right = self.binary(precedence + 1)
 
-    def factor(self):
-        expr = self.unary()
-        while self.match(TokenType.STAR, TokenType.SLASH):
-            op = self.previous()
-            right = self.factor()
-            expr = BinaryExpr(expr, op, right)
+            if op.type in (TokenType.AND, TokenType.OR):
+                expr = LogicalExpr(expr, op, right)
+            else:
+                expr = BinaryExpr(expr, op, right)
 
-        return expr
+    def precedence(self):
+        # of the binary operator at the current token, 0 if it isn't one
+        return PRECEDENCE.get(self.peek().type, 0)
 
     def unary(self):
-        if self.match(TokenType.MINUS, TokenType.BANG):
-            op = self.previous()
-            right = self.unary()
-            return UnaryExpr(op, right)
+        ops = []
+        while self.match(TokenType.MINUS, TokenType.BANG):
+            ops.append(self.previous())
 
-        return self.call()
+        expr = self.call()
+        for op in reversed(ops):
+            expr = UnaryExpr(op, expr)
+        return expr
 
     def call(self):
         expr = self.primary()
@@ -390,6 +396,9 @@ class Parser:
     def peek(self):
         return self.tokens[self.current]
 
+    def current_line(self):
+        return self.peek().line
+
     def at_end(self):
         return self.peek().type == TokenType.EOF
 
@@ -431,3 +440,76 @@ class Parser:
                 return
 
             self.advance()
+
+
+class StreamingParser(Parser):
+    """
+    Pulls tokens from an iterator instead of indexing a list. The grammar
+    never looks further than the current token and the one before it, so
+    those two are all that is kept.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.last = None
+        self.next = next(self.tokens)
+
+    def declarations(self):
+        # yields each top level declaration as soon as it is parsed, with
+        # None for the ones that had a syntax error
+        try:
+            while not self.at_end():
+                yield self.declaration()
+        except RecursionError:
+            self.error(self.peek(), "Too much nesting.")
+
+    def parse(self):
+        return list(self.declarations())
+
+    def peek(self):
+        return self.next
+
+    def previous(self):
+        return self.last
+
+    def advance(self):
+        if self.at_end():
+            return
+        self.last = self.next
+        self.next = next(self.tokens)
+
+
+class BufferParser(Parser):
+    """
+    Parses a TokenBuffer. Token types are tested against the buffer's type
+    codes, so Token objects are only made for the tokens that end up in the
+    tree or in an error message.
+    """
+
+    def __init__(self, buffer):
+        super().__init__(buffer)
+        self.types = buffer.types
+
+    def match(self, *types):
+        code = self.types[self.current]
+        if code == EOF_CODE:
+            return False
+
+        for type in types:
+            if code == type._value_:
+                self.current += 1
+                return True
+        return False
+
+    def at_end(self):
+        return self.types[self.current] == EOF_CODE
+
+    def check(self, type):
+        code = self.types[self.current]
+        return code == type._value_ and code != EOF_CODE
+
+    def precedence(self):
+        return CODE_PRECEDENCE.get(self.types[self.current], 0)
+
+    def current_line(self):
+        return self.tokens.lines[self.current]
@@ -0,0 +1,304 @@
+import json
+import signal
+import sys
+import threading
+import time
+
+from environment import Environment
+from interpreter import Interpreter, LoxFunction, TailCall
+
+# how many of the innermost frames of a stack a sample records, so that a
+# sample of deep recursion stays cheap
+MAX_SAMPLED_FRAMES = 128
+
+
+class FunctionStats:
+    __slots__ = ("name", "line", "calls", "inclusive", "exclusive", "active")
+
+    def __init__(self, name, line):
+        self.name = name
+        self.line = line
+        self.calls = 0
+        self.inclusive = 0.0  # seconds, counting recursive calls only once
+        self.exclusive = 0.0  # seconds, not counting the calls it made
+        self.active = 0  # calls currently running
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "line": self.line,
+            "calls": self.calls,
+            "inclusive": self.inclusive,
+            "exclusive": self.exclusive,
+        }
+
+
+class ProfiledFunction(LoxFunction):
+    def call(self, interpreter, args):
+        # LoxFunction.call, with every run of a body (tail calls included)
+        # going through the profiler
+        function = self
+        interpreter.depth += 1
+        try:
+            while True:
+                result = interpreter.profile(function, args)
+                if type(result) is not TailCall:
+                    break
+                function, args = result.function, result.args
+        finally:
+            interpreter.depth -= 1
+
+        if function.init:
+            return args[0]
+        if result is not None:
+            return result[0]
+
+
+class InstrumentedInterpreter(Interpreter):
+    # names functions the way the reports show them
+    def __init__(self, max_depth=None):
+        super().__init__(max_depth)
+        self.owners = {}  # FuncStmt of a method -> name of its class
+
+    def visit_class_statement(self, stmt):
+        for method in stmt.methods:
+            self.owners[method] = stmt.name.lexeme
+        return super().visit_class_statement(stmt)
+
+    def function_name(self, stmt):
+        if stmt in self.owners:
+            return f"{self.owners[stmt]}.{stmt.name.lexeme}"
+        return stmt.name.lexeme
+
+
+class ProfilingInterpreter(InstrumentedInterpreter):
+    """
+    The tree-walking interpreter, counting how often each line runs and how
+    often and for how long each function and method runs. None of it is
+    attached to the plain Interpreter, so normal runs don't pay for it.
+    """
+
+    def __init__(self, max_depth=None):
+        super().__init__(max_depth)
+        self.function_type = ProfiledFunction
+        self.functions = {}  # FuncStmt -> FunctionStats
+        self.lines = {}  # line -> number of statements run on it
+        self.children = [0.0]  # per running call, the time spent in its calls
+        self.started = time.perf_counter()
+
+    def execute(self, stmt):
+        self.lines[stmt.line] = self.lines.get(stmt.line, 0) + 1
+        return stmt.accept(self)
+
+    def execute_block(self, stmts, env):
+        previous = self.env
+        try:
+            self.env = env
+            for stmt in stmts:
+                result = self.execute(stmt)
+                if result is not None:
+                    return result
+        finally:
+            self.env = previous
+
+    def stats(self, stmt):
+        stats = self.functions.get(stmt)
+        if stats is None:
+            name = self.function_name(stmt)
+            stats = self.functions[stmt] = FunctionStats(name, stmt.name.line)
+        return stats
+
+    def profile(self, function, args):
+        stats = self.stats(function.stmt)
+        stats.calls += 1
+        stats.active += 1
+        self.children.append(0.0)
+        start = time.perf_counter()
+        try:
+            env = Environment(function.closure, args)
+            return self.execute_block(function.stmt.body, env)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.exclusive += elapsed - self.children.pop()
+            self.children[-1] += elapsed
+            stats.active -= 1
+            if not stats.active:
+                stats.inclusive += elapsed
+
+    # reports
+    def as_dict(self):
+        functions = sorted(
+            self.functions.values(), key=lambda stats: stats.exclusive, reverse=True
+        )
+        lines = sorted(self.lines.items(), key=lambda item: (-item[1], item[0]))
+        return {
+            "total": time.perf_counter() - self.started,
+            "functions": [stats.as_dict() for stats in functions],
+            "lines": [{"line": line, "count": count} for line, count in lines],
+        }
+
+    def report(self, file=sys.stderr, max_lines=20):
+        profile = self.as_dict()
+        print(f"profile: {profile['total']:.3f}s in total", file=file)
+        print(
+            f"{'calls':>9} {'total ms':>11} {'self ms':>11} {'self/call':>11}  function",
+            file=file,
+        )
+        for stats in profile["functions"]:
+            per_call = stats["exclusive"] * 1000 / stats["calls"]
+            print(
+                f"{stats['calls']:>9} {stats['inclusive'] * 1000:>11.3f} "
+                f"{stats['exclusive'] * 1000:>11.3f} {per_call:>11.4f}  "
+                f"{stats['name']} (line {stats['line']})",
+                file=file,
+            )
+
+        print(f"\n{'line':>9} {'runs':>11}", file=file)
+        for entry in profile["lines"][:max_lines]:
+            print(f"{entry['line']:>9} {entry['count']:>11}", file=file)
+        if len(profile["lines"]) > max_lines:
+            print(f"{'...':>9} {len(profile['lines']) - max_lines} more", file=file)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+class ShadowedFunction(LoxFunction):
+    def call(self, interpreter, args):
+        # LoxFunction.call, keeping the interpreter's shadow stack: a frame
+        # per running call, holding its FuncStmt and the line it is on
+        function = self
+        shadow = interpreter.shadow
+        frame = interpreter.frame = [function.stmt, function.stmt.name.line]
+        shadow.append(frame)
+        interpreter.depth += 1
+        try:
+            while True:
+                env = Environment(function.closure, args)
+                result = interpreter.execute_block(function.stmt.body, env)
+                if type(result) is not TailCall:
+                    break
+                # the callee takes over the frame of the call it replaces
+                function, args = result.function, result.args
+                frame[0] = function.stmt
+        finally:
+            interpreter.depth -= 1
+            shadow.pop()
+            interpreter.frame = shadow[-1]
+
+        if function.init:
+            return args[0]
+        if result is not None:
+            return result[0]
+
+
+class ShadowStackInterpreter(InstrumentedInterpreter):
+    """
+    The tree-walking interpreter, keeping a shadow stack of the Lox calls
+    that are running, so it can tell at any time which function and line is
+    running. Keeping the stack costs about as much as a list append and pop
+    per call and a store per statement.
+    """
+
+    def __init__(self, max_depth=None):
+        super().__init__(max_depth)
+        self.function_type = ShadowedFunction
+        self.frame = [None, 0]  # the script itself
+        self.shadow = [self.frame]
+
+    def execute(self, stmt):
+        self.frame[1] = stmt.line
+        return stmt.accept(self)
+
+    def execute_block(self, stmts, env):
+        previous = self.env
+        try:
+            self.env = env
+            for stmt in stmts:
+                self.frame[1] = stmt.line
+                result = stmt.accept(self)
+                if result is not None:
+                    return result
+        finally:
+            self.env = previous
+
+    def frame_name(self, stmt, line):
+        if line is None:
+            return "..."
+        if stmt is None:
+            return f"<script>:{line}"
+        return f"{self.function_name(stmt)}:{line}"
+
+
+class SamplingInterpreter(ShadowStackInterpreter):
+    """
+    The tree-walking interpreter, with a timer sampling its shadow stack. The
+    stack is cheap enough to keep that sampling can stay on for long runs.
+
+    The samples are written as folded stacks, one line per distinct stack:
+    the frames from the outermost in, as function:line and separated by
+    semicolons, followed by the number of samples. That is the input
+    flame graph tools take.
+    """
+
+    def __init__(self, max_depth=None, interval=0.001):
+        super().__init__(max_depth)
+        self.interval = interval  # seconds of cpu time between samples
+        self.samples = {}  # stack as a tuple of (FuncStmt, line) -> count
+        self.thread = None
+
+    def interpret(self, statements):
+        self.start()
+        try:
+            super().interpret(statements)
+        finally:
+            self.stop()
+
+    # sampling
+    def sample(self, *_):
+        shadow = self.shadow
+        stack = tuple([(stmt, line) for stmt, line in shadow[-MAX_SAMPLED_FRAMES:]])
+        if len(shadow) > MAX_SAMPLED_FRAMES:
+            # the script itself, then a frame standing for the ones left out
+            stack = ((None, shadow[0][1]), (None, None)) + stack
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def start(self):
+        # a profiling timer signal interrupts the interpreter right where it
+        # is, a thread is the fallback where there is no such signal
+        if hasattr(signal, "setitimer") and (
+            threading.current_thread() is threading.main_thread()
+        ):
+            signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            return
+
+        self.thread = threading.Thread(target=self.sample_thread, daemon=True)
+        self.thread.start()
+
+    def sample_thread(self):
+        while self.thread is not None:
+            time.sleep(self.interval)
+            self.sample()
+
+    def stop(self):
+        if self.thread is None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            thread, self.thread = self.thread, None
+            thread.join()
+
+    # reports
+    def folded(self):
+        stacks = {}
+        for stack, count in self.samples.items():
+            frames = ";".join(self.frame_name(stmt, line) for stmt, line in stack)
+            stacks[frames] = stacks.get(frames, 0) + count
+        return [f"{frames} {count}" for frames, count in sorted(stacks.items())]
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for line in self.folded():
+                f.write(line + "\n")
@@ -1,5 +1,6 @@
 from enum import Enum, auto
 from lox import *
+from expressions import CallExpr
 
 
 class FunctionType(Enum):
@@ -19,27 +20,43 @@ class Resolver:
     def __init__(self, interpreter):
         self.interpreter = interpreter
         self.scopes = []
+        self.work = []  # nodes and actions still to be resolved, last first
+        self.slots = []  # per scope, variable name -> slot in its Environment
         self.current_function = FunctionType.NONE
         self.current_class = ClassType.NONE
 
     def resolve(self, stmts_or_exprs):
-        if not isinstance(stmts_or_exprs, list):
+        if not isinstance(stmts_or_exprs, (list, tuple)):
             stmts_or_exprs = [stmts_or_exprs]
 
-        for stmt_or_expr in stmts_or_exprs:
-            stmt_or_expr.accept(self)
+        # Nodes are resolved off an explicit stack rather than by recursion,
+        # so any depth of nesting can be resolved. A visitor schedules the
+        # nodes it contains, followed by whatever has to happen once they
+        # have been resolved, as a tuple of a method and its arguments.
+        work = self.work
+        work.extend(reversed(stmts_or_exprs))
+        while work:
+            item = work.pop()
+            if type(item) is tuple:
+                item[0](*item[1:])
+            else:
+                item.accept(self)
+
+    def schedule(self, *items):
+        # runs the items in order, before anything scheduled earlier
+        self.work.extend(reversed(items))
 
     # interesting statements
     def visit_block_stmt(self, stmt):
         self.begin_scope()
-        self.resolve(stmt.stmts)
-        self.end_scope()
+        self.schedule(*stmt.stmts, (self.end_scope,))
 
     def visit_var_stmt(self, stmt):
         self.declare(stmt.name)
         if stmt.expr:
-            self.resolve(stmt.expr)
-        self.define(stmt.name)
+            self.schedule(stmt.expr, (self.define, stmt.name))
+        else:
+            self.define(stmt.name)
 
     def visit_func_statement(self, stmt):
         self.declare(stmt.name)
@@ -59,24 +76,24 @@ class Resolver:
                 return
 
             self.current_class = ClassType.SUBCLASS
-            self.resolve(stmt.supercls)
+            self.visit_variable_expr(stmt.supercls)
 
         if stmt.supercls:
             self.begin_scope()
             self.scopes[-1]["super"] = True
+            self.slots[-1]["super"] = 0
 
-        self.begin_scope()
-        self.scopes[-1]["this"] = True
+        methods = []
         for method in stmt.methods:
             type = (
                 FunctionType.INITIALIZER
                 if method.name.lexeme == "init"
                 else FunctionType.METHOD
             )
-            self.resolve_function(method, FunctionType.METHOD)
-
-        self.end_scope()
+            methods.append((self.resolve_function, method, type))
+        self.schedule(*methods, (self.end_class, stmt, enclosing_class))
 
+    def end_class(self, stmt, enclosing_class):
         if stmt.supercls:
             self.end_scope()
 
@@ -84,23 +101,22 @@ class Resolver:
 
     # lame statements
     def visit_print_stmt(self, stmt):
-        self.resolve(stmt.expr)
+        self.work.append(stmt.expr)
 
     def visit_assert_stmt(self, stmt):
-        self.resolve(stmt.expr)
+        self.work.append(stmt.expr)
 
     def visit_expr_stmt(self, stmt):
-        self.resolve(stmt.expr)
+        self.work.append(stmt.expr)
 
     def visit_if_statement(self, stmt):
-        self.resolve(stmt.condition)
-        self.resolve(stmt.then)
         if stmt.otherwise:
-            self.resolve(stmt.otherwise)
+            self.schedule(stmt.condition, stmt.then, stmt.otherwise)
+        else:
+            self.schedule(stmt.condition, stmt.then)
 
     def visit_while_statement(self, stmt):
-        self.resolve(stmt.condition)
-        self.resolve(stmt.stmt)
+        self.work += (stmt.stmt, stmt.condition)
 
     def visit_return_statement(self, stmt):
         if self.current_function == FunctionType.NONE:
@@ -112,7 +128,10 @@ class Resolver:
                 Lox.error(stmt.keyword, "Can't return a value from an initializer")
                 return
 
-            self.resolve(stmt.expr)
+            self.work.append(stmt.expr)
+            # the call is the last thing the function does, so the callee
+            # can run in place of it
+            stmt.tail = isinstance(stmt.expr, CallExpr)
 
     # interesting expressions
     def visit_variable_expr(self, expr):
@@ -122,41 +141,36 @@ class Resolver:
         self.resolve_local(expr, expr.name)
 
     def visit_assign_expr(self, expr):
-        self.resolve(expr.expr)
-        self.resolve_local(expr, expr.name)
+        self.work.append(expr.expr)
+        self.resolve_local(expr, expr.name)  # the value can't change scopes
 
     # lame expressions
     def visit_literal_expr(self, _expr):
         pass
 
     def visit_grouping_expr(self, expr):
-        self.resolve(expr.expr)
+        self.work.append(expr.expr)
 
     def visit_unary_expr(self, expr):
-        self.resolve(expr.right)
+        self.work.append(expr.right)
 
     def visit_binary_expr(self, expr):
-        self.resolve(expr.left)
-        self.resolve(expr.right)
+        self.work += (expr.right, expr.left)
 
     def visit_logical_expr(self, expr):
-        self.resolve(expr.left)
-        self.resolve(expr.right)
+        self.work += (expr.right, expr.left)
 
     def visit_call_expr(self, expr):
-        self.resolve(expr.callee)
-        for arg in expr.args:
-            self.resolve(arg)
+        self.schedule(expr.callee, *expr.args)
 
     def visit_get_expr(self, expr):
-        self.resolve(expr.obj)
+        self.work.append(expr.obj)
         # we never resolve the property that we are trying to get
         # that is dynamically looked from the object
         # (properties are not statically checked in lox)
 
     def visit_set_expr(self, expr):
-        self.resolve(expr.value)
-        self.resolve(expr.obj)
+        self.work += (expr.obj, expr.value)
         # likewise for set
 
     def visit_this_expr(self, expr):
@@ -178,9 +192,11 @@ class Resolver:
 
     def begin_scope(self):
         self.scopes.append(dict())
+        self.slots.append(dict())
 
     def end_scope(self):
         self.scopes.pop()
+        self.slots.pop()
 
     def declare(self, token):
         if not self.scopes:  # global scope
@@ -192,6 +208,7 @@ class Resolver:
             return
 
         scope[token.lexeme] = False
+        self.slots[-1][token.lexeme] = len(self.slots[-1])
 
     def define(self, token):
         if not self.scopes:
@@ -200,19 +217,25 @@ class Resolver:
         self.scopes[-1][token.lexeme] = True
 
     def resolve_local(self, expr, name):
-        for idx, scope in enumerate(reversed(self.scopes)):
-            if name.lexeme in scope:
-                self.interpreter.resolve(expr, idx)
+        for idx, slots in enumerate(reversed(self.slots)):
+            if name.lexeme in slots:
+                self.interpreter.resolve(expr, idx, slots[name.lexeme])
                 return
 
     def resolve_function(self, stmt, type):
         enclosing_function = self.current_function
         self.current_function = type
         self.begin_scope()
+        if type in (FunctionType.METHOD, FunctionType.INITIALIZER):
+            # `this` takes the first slot of a method's frame
+            self.scopes[-1]["this"] = True
+            self.slots[-1]["this"] = 0
         for param in stmt.params:
             self.declare(param)
             self.define(param)
 
-        self.resolve(stmt.body)
+        self.schedule(*stmt.body, (self.end_function, enclosing_function))
+
+    def end_function(self, enclosing_function):
         self.end_scope()
         self.current_function = enclosing_function
@@ -1,6 +1,30 @@
+import mmap
+import os
+import re
+import sys
 from tokens import *
 from lox import Lox
 
+KEYWORDS = {
+    "nil": TokenType.NIL,
+    "true": TokenType.TRUE,
+    "false": TokenType.FALSE,
+    "var": TokenType.VAR,
+    "print": TokenType.PRINT,
+    "assert": TokenType.ASSERT,
+    "if": TokenType.IF,
+    "else": TokenType.ELSE,
+    "and": TokenType.AND,
+    "or": TokenType.OR,
+    "while": TokenType.WHILE,
+    "for": TokenType.FOR,
+    "class": TokenType.CLASS,
+    "fun": TokenType.FUN,
+    "return": TokenType.RETURN,
+    "super": TokenType.SUPER,
+    "this": TokenType.THIS,
+}
+
 
 class Scanner:
     def __init__(self, source):
@@ -9,25 +33,6 @@ class Scanner:
         self.start = 0  # token start
         self.current = 0
         self.line = 1
-        self.keywords = {
-            "nil": TokenType.NIL,
-            "true": TokenType.TRUE,
-            "false": TokenType.FALSE,
-            "var": TokenType.VAR,
-            "print": TokenType.PRINT,
-            "assert": TokenType.ASSERT,
-            "if": TokenType.IF,
-            "else": TokenType.ELSE,
-            "and": TokenType.AND,
-            "or": TokenType.OR,
-            "while": TokenType.WHILE,
-            "for": TokenType.FOR,
-            "class": TokenType.CLASS,
-            "fun": TokenType.FUN,
-            "return": TokenType.RETURN,
-            "super": TokenType.SUPER,
-            "this": TokenType.THIS,
-        }
 
     def scan_tokens(self):
         while not self.at_end():
@@ -92,7 +97,7 @@ class Scanner:
         elif self.isalpha(c):
             self.identifier()
         else:
-            Lox.error(self.line, f"Unexpected character '{c}'.")
+            Lox.report(self.line, "", f"Unexpected character '{c}'.")
 
     def add_token(self, type, literal=None):
         text = self.source[self.start : self.current]
@@ -134,7 +139,7 @@ class Scanner:
             self.advance()
 
         if self.at_end():
-            Lox.error(line, "Unterminated string.")
+            Lox.report(self.line, "", "Unterminated string.")
             return
 
         self.advance()  # final "
@@ -160,7 +165,7 @@ class Scanner:
             self.advance()
 
         lexeme = self.source[self.start : self.current]
-        type = self.keywords.get(lexeme, TokenType.IDENTIFIER)
+        type = KEYWORDS.get(lexeme, TokenType.IDENTIFIER)
         self.add_token(type)
 
     def isalpha(self, ch):
@@ -168,3 +173,171 @@ class Scanner:
 
     def isalnum(self, ch):
         return ch.isalnum() or ch == "_"
+
+
+OPERATORS = {
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    "!": TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=": TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    "<": TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+    ">": TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+}
+
+# Every match is one token together with the blanks in front of it. The
+# alternatives are tried in order: the common ones first, `//` before `/`.
+TOKEN_PATTERN = re.compile(
+    r"""
+    [ \t\r]*
+    (?:
+        (?P<identifier>[^\W\d]\w*)
+      | (?P<operator>[!=<>]=?|[(){},.\-+;*])
+      | (?P<newline>\n)
+      | (?P<number>\d+(?:\.\d+)?)
+      | (?P<string>"[^"]*")
+      | (?P<comment>//[^\n]*)
+      | (?P<slash>/)
+      | (?P<unterminated>"[^"]*)
+      | (?P<error>.)
+      | (?P<end>\Z)
+    )
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+(
+    IDENTIFIER,
+    OPERATOR,
+    NEWLINE,
+    NUMBER,
+    STRING,
+    COMMENT,
+    SLASH,
+    UNTERMINATED,
+    ERROR,
+    END,  # blanks at the very end of the source
+) = range(1, 11)
+
+
+class RegexScanner:
+    """
+    Produces the same tokens and errors as Scanner, but lets one compiled
+    regex find every lexeme instead of looking at the source a character at a
+    time. Identifier lexemes are interned, so all tokens for one name share a
+    string and comparing them is cheap.
+    """
+
+    pattern = TOKEN_PATTERN
+
+    def __init__(self, source):
+        self.source = source
+
+    def scan_tokens(self):
+        return list(self.tokens())
+
+    def tokens(self):
+        return self.scan(self.source, str)
+
+    def scan(self, source, decode):
+        # `decode` turns a matched lexeme into a str
+        intern = sys.intern
+        keyword = KEYWORDS.get
+        line = 1
+        for match in self.pattern.finditer(source):
+            kind = match.lastindex
+            if kind == IDENTIFIER:
+                text = intern(decode(match[kind]))
+                yield Token(keyword(text, TokenType.IDENTIFIER), text, None, line)
+            elif kind == OPERATOR:
+                text = decode(match[kind])
+                yield Token(OPERATORS[text], text, None, line)
+            elif kind == NEWLINE:
+                line += 1
+            elif kind == NUMBER:
+                text = decode(match[kind])
+                yield Token(TokenType.NUMBER, text, float(text), line)
+            elif kind == STRING:
+                text = decode(match[kind])
+                line += text.count("\n")
+                yield Token(TokenType.STRING, text, text[1:-1], line)
+            elif kind == COMMENT:
+                pass
+            elif kind == SLASH:
+                yield Token(TokenType.SLASH, "/", None, line)
+            elif kind == UNTERMINATED:
+                line += decode(match[kind]).count("\n")
+                Lox.report(line, "", "Unterminated string.")
+            elif kind == ERROR:
+                Lox.report(line, "", f"Unexpected character '{decode(match[kind])}'.")
+
+        yield Token(TokenType.EOF, "", None, line)
+
+    def scan_buffer(self):
+        # the same scan, but into a TokenBuffer instead of Token objects
+        buffer = TokenBuffer(self.source)
+        append = buffer.append
+        keyword = KEYWORDS.get
+        line = 1
+        for match in self.pattern.finditer(self.source):
+            kind = match.lastindex
+            if kind == IDENTIFIER:
+                type = keyword(match[kind], TokenType.IDENTIFIER)
+                append(type, match.start(kind), match.end(kind), line)
+            elif kind == OPERATOR:
+                append(OPERATORS[match[kind]], match.start(kind), match.end(kind), line)
+            elif kind == NEWLINE:
+                line += 1
+            elif kind == NUMBER:
+                append(TokenType.NUMBER, match.start(kind), match.end(kind), line)
+            elif kind == STRING:
+                line += match[kind].count("\n")
+                append(TokenType.STRING, match.start(kind), match.end(kind), line)
+            elif kind == SLASH:
+                append(TokenType.SLASH, match.start(kind), match.end(kind), line)
+            elif kind == UNTERMINATED:
+                line += match[kind].count("\n")
+                Lox.report(line, "", "Unterminated string.")
+            elif kind == ERROR:
+                Lox.report(line, "", f"Unexpected character '{match[kind]}'.")
+
+        end = len(self.source)
+        append(TokenType.EOF, end, end, line)
+        return buffer
+
+
+def decode(text):
+    return text.decode("utf-8", "replace")
+
+
+class StreamingScanner(RegexScanner):
+    """
+    Scans a file without reading it into memory: the regex runs straight over
+    a memory map of the file and tokens are handed out one at a time. Matching
+    bytes limits identifiers to ASCII letters and digits.
+    """
+
+    pattern = re.compile(TOKEN_PATTERN.pattern.encode(), re.VERBOSE | re.DOTALL)
+
+    def __init__(self, path):
+        self.path = path
+
+    def tokens(self):
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:  # empty files can't be mapped
+                yield from self.scan(b"", decode)
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                yield from self.scan(source, decode)
@@ -2,12 +2,16 @@ from abc import abstractmethod, ABC
 
 
 class Stmt(ABC):
+    __slots__ = ("line",)  # set by the Parser
+
     @abstractmethod
     def accept(visitor):
         pass
 
 
 class PrintStmt(Stmt):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -16,6 +20,8 @@ class PrintStmt(Stmt):
 
 
 class AssertStmt(Stmt):
+    __slots__ = ("token", "expr")
+
     def __init__(self, token, expr):
         self.token = token  # for printing line number
         self.expr = expr
@@ -25,6 +31,8 @@ class AssertStmt(Stmt):
 
 
 class ExpressionStmt(Stmt):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -33,6 +41,8 @@ class ExpressionStmt(Stmt):
 
 
 class VarStmt(Stmt):
+    __slots__ = ("name", "expr")
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
@@ -42,14 +52,18 @@ class VarStmt(Stmt):
 
 
 class BlockStmt(Stmt):
+    __slots__ = ("stmts",)
+
     def __init__(self, stmts):
-        self.stmts = stmts
+        self.stmts = tuple(stmts)
 
     def accept(self, visitor):
         return visitor.visit_block_stmt(self)
 
 
 class IfStmt(Stmt):
+    __slots__ = ("condition", "then", "otherwise")
+
     def __init__(self, condition, then, otherwise):
         self.condition = condition
         self.then = then
@@ -60,6 +74,8 @@ class IfStmt(Stmt):
 
 
 class WhileStmt(Stmt):
+    __slots__ = ("condition", "stmt")
+
     def __init__(self, condition, stmt):
         self.condition = condition
         self.stmt = stmt
@@ -69,29 +85,48 @@ class WhileStmt(Stmt):
 
 
 class FuncStmt(Stmt):
+    __slots__ = ("name", "params", "body")
+
     def __init__(self, name, params, body):
         self.name = name
-        self.params = params
-        self.body = body
+        self.params = tuple(params)
+        self.body = tuple(body)
 
     def accept(self, visitor):
         return visitor.visit_func_statement(self)
 
 
 class ReturnStmt(Stmt):
+    __slots__ = ("keyword", "expr", "tail")
+
     def __init__(self, keyword, expr):
         self.keyword = keyword
         self.expr = expr
+        self.tail = False  # set by the Resolver for `return f(...)`
 
     def accept(self, visitor):
         return visitor.visit_return_statement(self)
 
 
 class ClassStmt(Stmt):
+    __slots__ = ("name", "supercls", "methods")
+
     def __init__(self, name, supercls, methods):
         self.name = name
         self.supercls = supercls
-        self.methods = methods
+        self.methods = tuple(methods)
 
     def accept(self, visitor):
         return visitor.visit_class_statement(self)
+
+
+class ProbeStmt(Stmt):
+    # wraps a statement for line_coverage.py, counting how often it runs
+    __slots__ = ("stmt", "hits")
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+        self.hits = 0
+
+    def accept(self, visitor):
+        return visitor.visit_probe_stmt(self)
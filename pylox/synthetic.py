@@ -0,0 +1,202 @@
+"""
+Generates Lox programs of any size, for measuring how the front end scales.
+
+A program is made of units of one shape, each with names of its own, added
+until the program is as big as asked for:
+
+    nesting    blocks, ifs, whiles and parenthesized expressions nested deeply
+    classes    a base class with a wide fan of subclasses calling super
+    functions  long functions of declarations, assignments, calls and loops
+    literals   tables of string, number, boolean and nil literals
+    mixed      all of the above, taking turns
+
+Units shrink for programs under 64 KB, so that even a 1 KB program is about
+1 KB. Programs are valid Lox: they scan, parse and resolve without errors.
+The same size, shape and seed always make the same program.
+"""
+
+import argparse
+import random
+import sys
+
+SHAPES = ("nesting", "classes", "functions", "literals", "mixed")
+
+UNITS = {"B": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+# programs smaller than this are made of smaller units
+FULL_UNITS_SIZE = 64 << 10
+
+
+def parse_size(text):
+    # "1000", "64K", "10MB", "1.5M" -> bytes
+    text = text.strip().upper()
+    if text.endswith("B") and len(text) > 1 and text[-2] in UNITS:
+        text = text[:-1]
+    scale = UNITS.get(text[-1:])
+    if scale is None:
+        return int(text)
+    return int(float(text[:-1]) * scale)
+
+
+def format_size(size):
+    for unit in ("GB", "MB", "KB"):
+        scale = UNITS[unit[0]]
+        if size >= scale:
+            return f"{size / scale:.3g} {unit}"
+    return f"{size} B"
+
+
+class ProgramGenerator:
+    def __init__(self, shape="mixed", seed=0, depth=32, width=16, length=200):
+        if shape not in SHAPES:
+            raise ValueError(f"unknown shape '{shape}'")
+        self.shape = shape
+        self.random = random.Random(seed)
+        self.full_units = (depth, width, length)
+        self.depth = depth  # how deeply nesting units nest
+        self.width = width  # subclasses per base class
+        self.length = length  # statements per function, rows per table
+        self.units = 0
+
+    def generate(self, size):
+        # the program as a str of at least size bytes
+        scale = min(1.0, size / FULL_UNITS_SIZE)
+        self.depth, self.width, self.length = (
+            max(2, int(n * scale)) for n in self.full_units
+        )
+
+        parts = [self.prelude()]
+        written = len(parts[0])
+        shapes = SHAPES[:-1] if self.shape == "mixed" else (self.shape,)
+        while written < size:
+            shape = shapes[self.units % len(shapes)]
+            unit = getattr(self, shape)(self.units)
+            parts.append(unit)
+            written += len(unit)
+            self.units += 1
+
+        return "".join(parts)
+
+    def prelude(self):
+        return (
+            "class Table {\n"
+            "  init() { this.size = 0; }\n"
+            "  put(key, value) { this.size = this.size + 1; return value; }\n"
+            "}\n\n"
+        )
+
+    # units
+    def nesting(self, n):
+        lines = [f"fun nested{n}(a, b) {{"]
+        indent = "  "
+        for level in range(self.depth):
+            kind = self.random.randrange(3)
+            if kind == 0:
+                lines.append(f"{indent}if (a < {level} or b == nil) {{")
+            elif kind == 1:
+                lines.append(f"{indent}while (a > {level} and !b) {{")
+            else:
+                lines.append(f"{indent}{{")
+            indent += "  "
+            lines.append(f"{indent}var v{level} = {self.nested_expr(level)};")
+            lines.append(f"{indent}a = a - v{level};")
+
+        for level in reversed(range(self.depth)):
+            indent = indent[:-2]
+            lines.append(f"{indent}}}")
+        lines.append("  return a;")
+        lines.append("}\n\n")
+        return "\n".join(lines)
+
+    def nested_expr(self, level):
+        expr = "a"
+        for i in range(min(level, 12)):
+            op = self.random.choice("+-*/")
+            expr = f"({expr} {op} {i + 1})"
+        return expr
+
+    def classes(self, n):
+        lines = [
+            f"class Base{n} {{",
+            "  init(x) { this.x = x; this.count = 0; }",
+            "  step(d) { this.count = this.count + d; return this; }",
+            "  value() { return this.x + this.count; }",
+            "}",
+        ]
+        for i in range(self.width):
+            lines += [
+                f"class Sub{n}_{i} < Base{n} {{",
+                f'  init(x) {{ super.init(x * {i + 1}); this.tag = "sub{i}"; }}',
+                f"  step(d) {{ return super.step(d + {i}); }}",
+                f"  value() {{ return super.value() - this.x / {i + 2}; }}",
+                "}",
+            ]
+        lines.append(f"var total{n} = 0;")
+        for i in range(self.width):
+            lines.append(f"total{n} = total{n} + Sub{n}_{i}({i}).step(1).value();")
+        lines.append("\n")
+        return "\n".join(lines)
+
+    def functions(self, n):
+        lines = [f"fun long{n}(p, q, r) {{", "  var acc = 0;"]
+        for i in range(self.length):
+            kind = self.random.randrange(5)
+            if kind == 0:
+                lines.append(f"  var l{i} = p * {i} + q - r;")
+            elif kind == 1:
+                lines.append(f"  acc = acc + {i} * (p - q);")
+            elif kind == 2:
+                lines.append(f"  if (acc > {i}) acc = acc - r; else acc = acc + 1;")
+            elif kind == 3:
+                lines.append(
+                    f"  for (var i = 0; i < {i % 7}; i = i + 1) acc = acc + i;"
+                )
+            else:
+                lines.append(f"  print acc == {i} and p != q or r;")
+        lines.append("  return acc;")
+        lines.append("}")
+        lines.append(f"print long{n}(1, 2, 3);\n\n")
+        return "\n".join(lines)
+
+    def literals(self, n):
+        lines = [f"var table{n} = Table();"]
+        for i in range(self.length):
+            lines.append(f'table{n}.put("key{n}_{i}", {self.literal()});')
+        lines.append("\n")
+        return "\n".join(lines)
+
+    def literal(self):
+        kind = self.random.randrange(6)
+        if kind == 0:
+            return str(self.random.randrange(1 << 20))
+        if kind == 1:
+            return f"{self.random.random() * 1000:.4f}"
+        if kind == 2:
+            return '"' + "".join(self.random.choices("abcdefghij ", k=24)) + '"'
+        if kind == 3:
+            return self.random.choice(("true", "false"))
+        if kind == 4:
+            return "nil"
+        return '"' + "".join(self.random.choices("xyz0123456789", k=8)) + '"'
+
+
+def generate(size, shape="mixed", seed=0, **options):
+    return ProgramGenerator(shape, seed, **options).generate(size)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(prog="synthetic")
+    argparser.add_argument("size", help="bytes to generate, e.g. 4096, 64K, 10MB")
+    argparser.add_argument("--shape", choices=SHAPES, default="mixed")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument(
+        "--output", metavar="FILE", help="write to FILE instead of stdout"
+    )
+    args = argparser.parse_args()
+
+    source = generate(parse_size(args.size), args.shape, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
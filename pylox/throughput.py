@@ -0,0 +1,266 @@
+"""
+Measures how each stage of the front end scales with the size of a program.
+
+Synthetic programs (see synthetic.py) of growing size go through the scanner,
+the parser and the resolver. Each stage is timed on its own and reported as
+a rate: tokens per second for the scanner, syntax tree nodes per second for
+the parser and the resolver. The memory the tokens and the tree hold is
+reported per token and per node.
+
+A stage that scales linearly keeps its rate as programs grow. Between each
+two sizes the driver also works out the exponent of the stage's time against
+its amount of work (1.0 for linear, 2.0 for quadratic) and marks exponents
+above 1.2 as super-linear, so the stage that stops scaling first stands out.
+Times under 10ms are mostly noise, so no exponent is worked out from them.
+
+    python throughput.py --shape nesting --max-size 10M --output nesting.json
+"""
+
+import argparse
+import gc
+import json
+import math
+import sys
+import time
+
+from ast_cache import flatten
+from interpreter import Interpreter
+from lox import Lox
+from parser import BufferParser, Parser
+from resolver import Resolver
+from scanner import RegexScanner, Scanner
+from synthetic import SHAPES, format_size, generate, parse_size
+from tokens import TokenBuffer
+
+DEFAULT_SIZES = "1K,10K,100K,1M,10M,100M"
+SUPER_LINEAR = 1.2
+MIN_TIME = 0.01  # seconds, the least a stage must take to be compared
+STAGES = ("scan", "parse", "resolve")
+
+
+def retained_size(roots):
+    """
+    Bytes held by roots and everything they refer to, counting shared objects
+    once. Follows the containers and __slots__ objects the front end makes,
+    but not classes, enum members or the source the tokens point into.
+    """
+    seen = set()
+    total = 0
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if type(obj) is tuple or type(obj) is list:
+            stack.extend(item for item in obj if is_owned(item))
+        elif hasattr(type(obj), "__slots__"):
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    field = getattr(obj, slot, None)
+                    if is_owned(field):
+                        stack.append(field)
+    return total
+
+
+def is_owned(obj):
+    # None, booleans and enum members exist once for the whole process
+    return obj is not None and type(obj) is not bool and not hasattr(obj, "_value_")
+
+
+def token_memory(tokens):
+    if isinstance(tokens, TokenBuffer):
+        arrays = (tokens.types, tokens.starts, tokens.ends, tokens.lines)
+        return sys.getsizeof(tokens) + sum(sys.getsizeof(array) for array in arrays)
+    return retained_size([tokens])
+
+
+def tree_memory(statements):
+    # Tokens a BufferParser made for the tree count as the tree's
+    return retained_size([statements])
+
+
+def measure(source, scanner="regex", repeat=3):
+    """
+    Runs the front end over source, repeat times unless a run takes over a
+    second, and returns the best time of each stage with the amounts of work.
+    """
+    best = {stage: math.inf for stage in STAGES}
+    for _ in range(repeat):
+        Lox.had_error = False
+        tokens = statements = None
+        gc.collect()
+
+        start = time.perf_counter()
+        if scanner == "regex":
+            tokens = RegexScanner(source).scan_buffer()
+        else:
+            tokens = Scanner(source).scan_tokens()
+        scanned = time.perf_counter()
+
+        parser = BufferParser(tokens) if scanner == "regex" else Parser(tokens)
+        statements = parser.parse()
+        parsed = time.perf_counter()
+
+        Resolver(Interpreter()).resolve(statements)
+        resolved = time.perf_counter()
+
+        if Lox.had_error:
+            raise ValueError("the generated program has errors")
+        for stage, elapsed in zip(
+            STAGES, (scanned - start, parsed - scanned, resolved - parsed)
+        ):
+            best[stage] = min(best[stage], elapsed)
+        if resolved - start > 1.0:
+            break
+
+    nodes = len(flatten(statements))
+    return {
+        "bytes": len(source.encode()),
+        "tokens": len(tokens),
+        "nodes": nodes,
+        "token_bytes": token_memory(tokens) / len(tokens),
+        "node_bytes": tree_memory(statements) / nodes,
+        "times": best,
+    }
+
+
+def work(result, stage):
+    return result["tokens"] if stage == "scan" else result["nodes"]
+
+
+def add_exponents(results):
+    # between each two sizes, how a stage's time grew against its work
+    for previous, result in zip(results, results[1:]):
+        result["exponents"] = {}
+        for stage in STAGES:
+            before, after = previous["times"][stage], result["times"][stage]
+            if min(before, after) < MIN_TIME:
+                continue
+            grew = work(result, stage) / work(previous, stage)
+            if grew > 1:
+                result["exponents"][stage] = math.log(after / before) / math.log(grew)
+
+
+def report_size(result, file=sys.stdout):
+    rates = "".join(
+        f" {work(result, stage) / result['times'][stage]:>11,.0f}" for stage in STAGES
+    )
+    exponents = ""
+    for stage in STAGES:
+        exponent = result.get("exponents", {}).get(stage)
+        if exponent is None:
+            exponents += f" {'-':>7} "
+        else:
+            exponents += f" {exponent:>7.2f}" + (
+                "*" if exponent > SUPER_LINEAR else " "
+            )
+    print(
+        f"{format_size(result['bytes']):>9} {result['tokens']:>10,} "
+        f"{result['nodes']:>10,}{rates}{exponents} "
+        f"{result['token_bytes']:>7.1f} {result['node_bytes']:>7.1f}",
+        file=file,
+        flush=True,
+    )
+
+
+def report_header(file=sys.stdout):
+    print(
+        f"{'size':>9} {'tokens':>10} {'nodes':>10} {'tokens/s':>11} "
+        f"{'parse n/s':>11} {'resolve n/s':>11} {'scan ^':>8} {'parse ^':>8} "
+        f"{'resolve ^':>8} {'B/token':>7} {'B/node':>7}",
+        file=file,
+    )
+
+
+def first_to_stop_scaling(results):
+    # the stage and size where an exponent first goes super-linear
+    for result in results:
+        exponents = result.get("exponents", {})
+        worst = max(STAGES, key=lambda stage: exponents.get(stage, 0))
+        if exponents.get(worst, 0) > SUPER_LINEAR:
+            return worst, result
+    return None
+
+
+def run(sizes, shape="mixed", scanner="regex", repeat=3, seed=0, output=None):
+    results = []
+    report_header()
+    for size in sizes:
+        source = generate(size, shape, seed)
+        results.append(measure(source, scanner, repeat))
+        del source
+        add_exponents(results)
+        report_size(results[-1])
+
+        # written as it goes, as the biggest sizes may not fit in memory
+        if output:
+            with open(output, "w") as f:
+                json.dump(
+                    {"shape": shape, "scanner": scanner, "results": results},
+                    f,
+                    indent=2,
+                )
+
+    stopped = first_to_stop_scaling(results)
+    if not any(result.get("exponents") for result in results):
+        print(f"\nno stage took {MIN_TIME * 1000:.0f}ms at two sizes, try bigger sizes")
+    elif stopped is None:
+        print("\nevery stage scaled linearly")
+    else:
+        stage, result = stopped
+        print(
+            f"\n{stage} stopped scaling first, at {format_size(result['bytes'])} "
+            f"(exponent {result['exponents'][stage]:.2f})"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(prog="throughput")
+    argparser.add_argument(
+        "--shape",
+        choices=SHAPES,
+        default="mixed",
+        help="what the generated programs are made of (default: mixed)",
+    )
+    argparser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"comma separated program sizes (default: {DEFAULT_SIZES})",
+    )
+    argparser.add_argument(
+        "--max-size",
+        metavar="SIZE",
+        help="leave out the sizes above SIZE, the biggest need gigabytes of memory",
+    )
+    argparser.add_argument(
+        "--scanner",
+        choices=["regex", "classic"],
+        default="regex",
+        help="tokenizer (default: one compiled regex, classic: char by char)",
+    )
+    argparser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per size, the best time of each stage counts (default: 3)",
+    )
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument(
+        "--output", metavar="FILE", help="write the results to FILE as JSON"
+    )
+    args = argparser.parse_args()
+
+    try:
+        sizes = sorted(parse_size(size) for size in args.sizes.split(","))
+        if args.max_size:
+            sizes = [size for size in sizes if size <= parse_size(args.max_size)]
+    except ValueError:
+        argparser.error("sizes look like 4096, 64K or 10MB")
+    if args.repeat < 1:
+        argparser.error("--repeat must be at least 1")
+
+    run(sizes, args.shape, args.scanner, args.repeat, args.seed, args.output)
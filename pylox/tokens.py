@@ -1,3 +1,5 @@
+import sys
+from array import array
 from enum import Enum, auto
 
 
@@ -53,6 +55,8 @@ class TokenType(Enum):
 
 
 class Token:
+    __slots__ = ("type", "lexeme", "literal", "line")
+
     def __init__(self, type, lexeme, literal, line):
         self.type = type
         self.lexeme = lexeme
@@ -64,3 +68,49 @@ class Token:
 
     def __repr__(self):
         return f"Token({self.type}, {self.lexeme}, {self.literal}, {self.line})"
+
+
+# TokenType by its value, which is what a TokenBuffer stores
+TOKEN_TYPES = (None,) + tuple(TokenType)
+
+
+class TokenBuffer:
+    """
+    The tokens of one source as a struct of arrays: a byte for the type and
+    unsigned ints for where the lexeme starts and ends and for the line. That
+    is 13 bytes per token instead of a Token object each.
+
+    Lexemes and literals are only cut out of the source, a str, when a Token
+    is asked for.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.types = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.lines = array("I")
+
+    def append(self, type, start, end, line):
+        self.types.append(type._value_)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+
+    def __len__(self):
+        return len(self.types)
+
+    def lexeme(self, index):
+        return self.source[self.starts[index] : self.ends[index]]
+
+    def __getitem__(self, index):
+        type = TOKEN_TYPES[self.types[index]]
+        lexeme = self.lexeme(index)
+        literal = None
+        if type == TokenType.IDENTIFIER:
+            lexeme = sys.intern(lexeme)
+        elif type == TokenType.NUMBER:
+            literal = float(lexeme)
+        elif type == TokenType.STRING:
+            literal = lexeme[1:-1]
+        return Token(type, lexeme, literal, self.lines[index])
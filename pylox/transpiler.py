@@ -0,0 +1,948 @@
+"""
+Translates a resolved Lox program into python source, so that CPython's own
+bytecode loop runs the program.
+
+ * Lox globals are python globals of the namespace the code runs in, Lox
+   locals are python locals of the enclosing function, renamed so that block
+   scoping and shadowing survive the flattening into one python scope.
+ * Lox functions are python functions, methods take `this` as their first
+   parameter and classes are python classes built by `LoxClass`.
+ * A local declared inside a loop body and captured by a closure gets a fresh
+   one element list (a box) per iteration, and the closures take the box as
+   a keyword-only default, the way a new Environment is created for every
+   iteration of the tree-walker.
+ * Operators are inlined with the type checks Lox requires. Errors report
+   the same messages and lines as the tree-walker, but when a check fails the
+   sibling operands have already been evaluated, so their side effects may
+   show up before the error does.
+"""
+
+import hashlib
+import importlib.util
+import keyword
+import marshal
+import math
+import os
+import time
+import types
+
+from lox import Lox
+from ast_cache import CACHE_DIR
+from tokens import Token, TokenType
+from expressions import *
+from statements import *
+from interpreter import (
+    DEFAULT_MAX_DEPTH,
+    RunTimeError,
+    c_stack_limit,
+    make_room,
+    stringify,
+)
+
+VERSION = 5
+
+
+def attribute_name(name):
+    # field and method names become python attributes, keep them clear of
+    # python keywords and of dunder names
+    if name.startswith("_") or keyword.iskeyword(name):
+        return "_L" + name
+    return name
+
+
+def runtime_error(line, msg):
+    return RunTimeError(Token(TokenType.EOF, "", None, line), msg)
+
+
+def fail(line, msg):
+    raise runtime_error(line, msg)
+
+
+# runtime support, used by the generated code
+MISSING = object()
+
+
+class LoxInstance:
+    def __str__(self):
+        return f"{type(self).__lox_name__} instance"
+
+
+class LoxClass(type):
+    def __call__(cls, *args):
+        instance = cls.__new__(cls)
+        if cls.__lox_init__ is not None:
+            cls.__lox_init__(instance, *args)
+        return instance
+
+    @property
+    def __lox_arity__(cls):
+        if cls.__lox_init__ is None:
+            return 0
+        return cls.__lox_init__.__lox_arity__
+
+    def __str__(cls):
+        return cls.__lox_name__
+
+
+class BoundMethod:
+    # A method read off an instance as a value. Python's own bound methods
+    # are equal whenever they bind the same method to the same instance, Lox
+    # ones only to themselves. Methods that are called right away are never
+    # seen as values and stay python's.
+    __slots__ = ("method", "__lox_arity__")
+
+    def __init__(self, method):
+        self.method = method
+        self.__lox_arity__ = method.__lox_arity__
+
+    def __call__(self, *args):
+        return self.method(*args)
+
+    def __str__(self):
+        return stringify_value(self.method.__func__)
+
+
+def stringify_value(value):
+    # generated functions are plain python functions, named by the transpiler
+    if type(value) is types.FunctionType:
+        name = getattr(value, "__lox_name__", None)
+        return "<native fn>" if name is None else f"<fn {name}>"
+    return stringify(value)
+
+
+def find_method(cls, name):
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+
+def make_class(name, supercls, methods):
+    cls = LoxClass(
+        name, (LoxInstance if supercls is None else supercls,), dict(methods)
+    )
+    cls.__lox_name__ = name
+    cls.__lox_init__ = find_method(cls, "init")
+    return cls
+
+
+def check_superclass(supercls, line):
+    if not isinstance(supercls, LoxClass):
+        raise runtime_error(line, "superclass must be a class.")
+    return supercls
+
+
+def super_method(supercls, instance, name, line):
+    method = find_method(supercls, attribute_name(name))
+    if method is None:
+        raise runtime_error(line, f"Undefined property {name}.")
+    return method.__get__(instance)
+
+
+def call(callee, line, *args):
+    # the slow path, the generated code calls matching callables directly
+    arity = getattr(callee, "__lox_arity__", None)
+    if arity is None:
+        raise runtime_error(line, "can only call functions.")
+    if arity != len(args):
+        raise runtime_error(line, f"Expected {arity} arguments, {len(args)} provided.")
+    return callee(*args)
+
+
+def get_error(obj, name, line):
+    if isinstance(obj, LoxInstance):
+        raise runtime_error(line, f"Undefined property {name}.")
+    raise runtime_error(line, "only instances can have properties.")
+
+
+def set_attribute(obj, attribute, value, line):
+    if not isinstance(obj, LoxInstance):
+        raise runtime_error(line, "only instances can set properties.")
+    setattr(obj, attribute, value)
+    return value
+
+
+def set_box(box, value):
+    box[0] = value
+    return value
+
+
+def divide_error(left, right, line):
+    if type(left) is not float or type(right) is not float:
+        raise runtime_error(line, "Operands must be numbers.")
+    raise runtime_error(line, "Division by zero.")
+
+
+def clock():
+    return time.time()
+
+
+clock.__lox_arity__ = 0
+
+
+def make_namespace():
+    namespace = {
+        "_float": float,
+        "_str": str,
+        "_addable": (float, str),
+        "_missing": MISSING,
+        "_instance": LoxInstance,
+        "_method": types.MethodType,
+        "_bind": BoundMethod,
+        "_stringify": stringify_value,
+        "_fail": fail,
+        "_make_class": make_class,
+        "_check_superclass": check_superclass,
+        "_super_method": super_method,
+        "_call": call,
+        "_get_error": get_error,
+        "_set_attribute": set_attribute,
+        "_set_box": set_box,
+        "_divide_error": divide_error,
+        "_lox_lines": {},  # file name -> the Lox line of every python line
+        "g_clock": clock,
+    }
+
+    def get_global(py_name, name, line):
+        try:
+            return namespace[py_name]
+        except KeyError:
+            raise runtime_error(line, f"Undefined variable '{name}'.")
+
+    def set_global(py_name, name, value, line):
+        if py_name not in namespace:
+            raise runtime_error(line, f"Undefined variable '{name}'.")
+        namespace[py_name] = value
+        return value
+
+    namespace["_get_global"] = get_global
+    namespace["_set_global"] = set_global
+    return namespace
+
+
+# static analysis
+class Var:
+    __slots__ = ("py_name", "function", "in_loop", "captured")
+
+    def __init__(self, py_name, function, in_loop):
+        self.py_name = py_name
+        self.function = function
+        self.in_loop = in_loop
+        self.captured = False
+
+    @property
+    def boxed(self):
+        return self.captured and self.in_loop
+
+
+class FunctionInfo:
+    def __init__(self, parent):
+        self.parent = parent
+        self.loop_depth = 0
+        self.captures = set()  # Vars used here or in nested functions
+        self.nonlocals = set()  # python names assigned here, declared outside
+        self.globals = set()  # python names of globals assigned here
+
+
+class ScopeAnalyzer:
+    """
+    Mirrors the Resolver's scoping rules, but records which python variable
+    every declaration and reference maps to and which variables closures
+    capture.
+    """
+
+    def __init__(self):
+        self.scopes = []
+        self.function = FunctionInfo(None)
+        self.main = self.function
+        self.functions = {}  # FuncStmt -> FunctionInfo
+        self.decls = {}  # declaring node -> Var
+        self.params = {}  # FuncStmt -> [Var]
+        self.refs = {}  # referencing node -> Var, None for globals
+        self.supers = {}  # ClassStmt -> Var holding the superclass
+        self.counter = 0
+
+    def analyze(self, stmts):
+        for stmt in stmts:
+            stmt.accept(self)
+
+    def declare(self, name, py_name=None):
+        if not self.scopes:
+            return None
+
+        self.counter += 1
+        if py_name is None:
+            py_name = f"l{self.counter}_{name}"
+        var = Var(py_name, self.function, self.function.loop_depth > 0)
+        self.scopes[-1][name] = var
+        return var
+
+    def reference(self, node, name, assign=False):
+        var = None
+        for scope in reversed(self.scopes):
+            if name in scope:
+                var = scope[name]
+                break
+
+        self.refs[node] = var
+        if var is None:
+            if assign:
+                self.function.globals.add("g_" + name)
+            return
+
+        function = self.function
+        if var.function is not function:
+            var.captured = True
+            if assign and not var.boxed:
+                function.nonlocals.add(var.py_name)
+            while function is not var.function:
+                function.captures.add(var)
+                function = function.parent
+
+    def function_scope(self, stmt, is_method):
+        self.function = FunctionInfo(self.function)
+        self.functions[stmt] = self.function
+        self.scopes.append({})
+        params = []
+        if is_method:
+            params.append(self.declare("this", "this"))
+        for param in stmt.params:
+            params.append(self.declare(param.lexeme))
+        self.params[stmt] = params
+
+        self.analyze(stmt.body)
+        self.scopes.pop()
+        self.function = self.function.parent
+
+    def visit_print_stmt(self, stmt):
+        stmt.expr.accept(self)
+
+    def visit_assert_stmt(self, stmt):
+        stmt.expr.accept(self)
+
+    def visit_expr_stmt(self, stmt):
+        stmt.expr.accept(self)
+
+    def visit_var_stmt(self, stmt):
+        if stmt.expr:
+            stmt.expr.accept(self)
+        self.decls[stmt] = self.declare(stmt.name.lexeme)
+        if not self.scopes:
+            self.function.globals.add("g_" + stmt.name.lexeme)
+
+    def visit_block_stmt(self, stmt):
+        self.scopes.append({})
+        self.analyze(stmt.stmts)
+        self.scopes.pop()
+
+    def visit_if_statement(self, stmt):
+        stmt.condition.accept(self)
+        stmt.then.accept(self)
+        if stmt.otherwise:
+            stmt.otherwise.accept(self)
+
+    def visit_while_statement(self, stmt):
+        stmt.condition.accept(self)
+        self.function.loop_depth += 1
+        stmt.stmt.accept(self)
+        self.function.loop_depth -= 1
+
+    def visit_func_statement(self, stmt):
+        self.decls[stmt] = self.declare(stmt.name.lexeme)
+        if not self.scopes:
+            self.function.globals.add("g_" + stmt.name.lexeme)
+        self.function_scope(stmt, False)
+
+    def visit_class_statement(self, stmt):
+        if stmt.supercls:
+            stmt.supercls.accept(self)
+        self.decls[stmt] = self.declare(stmt.name.lexeme)
+        if not self.scopes:
+            self.function.globals.add("g_" + stmt.name.lexeme)
+
+        self.scopes.append({})
+        self.counter += 1
+        if stmt.supercls:
+            # `super` is not a Lox identifier, so this can't shadow anything
+            self.supers[stmt] = self.declare("super", f"l{self.counter}_super")
+        for method in stmt.methods:
+            self.function_scope(method, True)
+        self.scopes.pop()
+
+    def visit_return_statement(self, stmt):
+        if stmt.expr:
+            stmt.expr.accept(self)
+
+    def visit_literal_expr(self, expr):
+        pass
+
+    def visit_grouping_expr(self, expr):
+        expr.expr.accept(self)
+
+    def visit_unary_expr(self, expr):
+        expr.right.accept(self)
+
+    def visit_binary_expr(self, expr):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_logical_expr(self, expr):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_variable_expr(self, expr):
+        self.reference(expr, expr.name.lexeme)
+
+    def visit_assign_expr(self, expr):
+        expr.expr.accept(self)
+        self.reference(expr, expr.name.lexeme, assign=True)
+
+    def visit_call_expr(self, expr):
+        expr.callee.accept(self)
+        for arg in expr.args:
+            arg.accept(self)
+
+    def visit_get_expr(self, expr):
+        expr.obj.accept(self)
+
+    def visit_set_expr(self, expr):
+        expr.obj.accept(self)
+        expr.value.accept(self)
+
+    def visit_this_expr(self, expr):
+        self.reference(expr, "this")
+
+    def visit_super_expr(self, expr):
+        self.reference(expr, "super")
+        self.reference(expr.keyword, "this")
+
+
+# code generation
+BOOLEAN_OPS = (
+    TokenType.EQUAL_EQUAL,
+    TokenType.BANG_EQUAL,
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+)
+
+NUMERIC_OPS = {
+    TokenType.MINUS: "-",
+    TokenType.STAR: "*",
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUAL: "<=",
+}
+
+
+def is_boolean(expr):
+    if isinstance(expr, GroupingExpr):
+        return is_boolean(expr.expr)
+    if isinstance(expr, LiteralExpr):
+        return isinstance(expr.value, bool)
+    if isinstance(expr, UnaryExpr):
+        return expr.op.type == TokenType.BANG
+    if isinstance(expr, BinaryExpr):
+        return expr.op.type in BOOLEAN_OPS
+    return False
+
+
+# never in generated code otherwise, literals are written with repr()
+CALL_SITE = "\0"
+
+
+def literal(value):
+    if value is None or isinstance(value, bool):
+        return repr(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        return f"_float({str(value)!r})"
+    return repr(value)
+
+
+class Transpiler:
+    def __init__(self, defined_globals=()):
+        # globals that are certainly defined by the time the code being
+        # generated runs can be read and written without checks
+        self.defined = set(defined_globals)
+        self.lines = []
+        self.lox_lines = []  # the Lox line each python line comes from
+        self.line = 0
+        self.indent = 0
+        self.temps = [0]
+        self.function = None
+        self.init = False
+        self.analyzer = ScopeAnalyzer()
+
+    def transpile(self, statements):
+        self.analyzer.analyze(statements)
+        self.function = self.analyzer.main
+
+        self.emit("def _lox_main():")
+        self.indent += 1
+        self.emit_declarations(self.function)
+        self.emit_block(statements)
+        self.indent -= 1
+        lox_lines = tuple(self.lox_lines)
+        self.emit(f"_lox_lines[_lox_main.__code__.co_filename] = {lox_lines!r}")
+        self.emit("_lox_main()")
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, line):
+        # Every call marks where it starts with the Lox line of its paren,
+        # between two CALL_SITEs. It starts a python line of its own there,
+        # inside the parentheses around it, so python reports a stack
+        # overflow at the line of the call rather than of the statement.
+        pieces = line.split(CALL_SITE)
+        self.lines.append("    " * self.indent + pieces[0])
+        self.lox_lines.append(self.line)
+        for idx in range(1, len(pieces), 2):
+            self.lines.append(pieces[idx + 1])
+            self.lox_lines.append(int(pieces[idx]))
+
+    def emit_block(self, stmts):
+        start = len(self.lines)
+        for stmt in stmts:
+            self.line = stmt.line
+            stmt.accept(self)
+        if len(self.lines) == start:
+            self.emit("pass")
+
+    def emit_declarations(self, function):
+        if function.globals:
+            self.emit("global " + ", ".join(sorted(function.globals)))
+        if function.nonlocals:
+            self.emit("nonlocal " + ", ".join(sorted(function.nonlocals)))
+
+    def temp(self):
+        self.temps[-1] += 1
+        return f"_t{self.temps[-1]}"
+
+    def truthy(self, expr):
+        if is_boolean(expr):
+            return expr.accept(self)
+        t = self.temp()
+        return f"(({t} := {expr.accept(self)}) is not None and {t} is not False)"
+
+    # variables
+    def read(self, node, name, line):
+        var = self.analyzer.refs[node]
+        if var is None:
+            py_name = "g_" + name
+            if py_name in self.defined:
+                return py_name
+            return f"_get_global({py_name!r}, {name!r}, {line})"
+        if var.boxed:
+            return f"{var.py_name}[0]"
+        return var.py_name
+
+    def write(self, node, name, value, line):
+        var = self.analyzer.refs[node]
+        if var is None:
+            py_name = "g_" + name
+            if py_name in self.defined:
+                return f"({py_name} := {value})"
+            return f"_set_global({py_name!r}, {name!r}, {value}, {line})"
+        if var.boxed:
+            return f"_set_box({var.py_name}, {value})"
+        return f"({var.py_name} := {value})"
+
+    def define(self, stmt, name, value):
+        var = self.analyzer.decls[stmt]
+        if var is None:
+            py_name = "g_" + name
+            self.emit(f"{py_name} = {value}")
+            self.defined.add(py_name)
+        elif var.boxed:
+            self.emit(f"{var.py_name} = [{value}]")
+        else:
+            self.emit(f"{var.py_name} = {value}")
+
+    def emit_function(self, stmt, py_name, is_method, init=False):
+        info = self.analyzer.functions[stmt]
+        params = [var.py_name for var in self.analyzer.params[stmt]]
+        # boxes of the current iteration are bound when the function is created
+        snapshots = sorted(
+            var.py_name
+            for var in info.captures
+            if var.boxed and var.function is self.function
+        )
+        if snapshots:
+            params.append("*")
+            params.extend(f"{name}={name}" for name in snapshots)
+
+        self.emit(f"def {py_name}({', '.join(params)}):")
+        self.indent += 1
+        enclosing, enclosing_init = self.function, self.init
+        self.function, self.init = info, init
+        self.temps.append(0)
+        self.emit_declarations(info)
+
+        self.emit_block(stmt.body)
+        if init:
+            self.emit("return this")
+
+        self.temps.pop()
+        self.function, self.init = enclosing, enclosing_init
+        self.indent -= 1
+        arity = len(stmt.params)
+        self.emit(f"{py_name}.__lox_arity__ = {arity}")
+        self.emit(f"{py_name}.__lox_name__ = {stmt.name.lexeme!r}")
+
+    # statements
+    def visit_print_stmt(self, stmt):
+        self.emit(f"print(_stringify({stmt.expr.accept(self)}))")
+
+    def visit_assert_stmt(self, stmt):
+        t = self.temp()
+        self.emit(
+            f"if ({t} := {stmt.expr.accept(self)}) is None or {t} is False: "
+            f"_fail({stmt.token.line}, 'Assert Failed.')"
+        )
+
+    def visit_expr_stmt(self, stmt):
+        expr = stmt.expr
+        if isinstance(expr, AssignExpr):
+            name = expr.name
+            assign = self.write(expr, name.lexeme, expr.expr.accept(self), name.line)
+            if assign.startswith("("):
+                # a plain assignment statement instead of a walrus
+                assign = assign[1:-1].replace(" := ", " = ", 1)
+            self.emit(assign)
+        elif isinstance(expr, SetExpr):
+            t = self.temp()
+            name = expr.name
+            self.emit(
+                f"if not isinstance({t} := {expr.obj.accept(self)}, _instance): "
+                f"_fail({name.line}, 'only instances can set properties.')"
+            )
+            self.emit(f"{t}.{attribute_name(name.lexeme)} = {expr.value.accept(self)}")
+        else:
+            self.emit(expr.accept(self))
+
+    def visit_var_stmt(self, stmt):
+        value = stmt.expr.accept(self) if stmt.expr else "None"
+        self.define(stmt, stmt.name.lexeme, value)
+
+    def visit_block_stmt(self, stmt):
+        for block_stmt in stmt.stmts:
+            self.line = block_stmt.line
+            block_stmt.accept(self)
+
+    def visit_if_statement(self, stmt):
+        self.emit(f"if {self.truthy(stmt.condition)}:")
+        self.indent += 1
+        self.emit_block([stmt.then])
+        self.indent -= 1
+        if stmt.otherwise:
+            self.emit("else:")
+            self.indent += 1
+            self.emit_block([stmt.otherwise])
+            self.indent -= 1
+
+    def visit_while_statement(self, stmt):
+        self.emit(f"while {self.truthy(stmt.condition)}:")
+        self.indent += 1
+        self.emit_block([stmt.stmt])
+        self.indent -= 1
+
+    def visit_func_statement(self, stmt):
+        var = self.analyzer.decls[stmt]
+        name = stmt.name.lexeme
+        if var is None:
+            # defined before the body runs, the body may call it unchecked
+            self.defined.add("g_" + name)
+            self.emit_function(stmt, "g_" + name, False)
+        elif var.boxed:
+            # the box has to exist before the function snapshots it
+            self.emit(f"{var.py_name} = [None]")
+            py_name = f"_f{self.analyzer.counter}_{name}"
+            self.analyzer.counter += 1
+            self.emit_function(stmt, py_name, False)
+            self.emit(f"{var.py_name}[0] = {py_name}")
+        else:
+            self.emit_function(stmt, var.py_name, False)
+
+    def visit_class_statement(self, stmt):
+        name = stmt.name.lexeme
+        supercls = "None"
+        if stmt.supercls:
+            supercls = (
+                f"_check_superclass({stmt.supercls.accept(self)}, "
+                f"{stmt.supercls.name.line})"
+            )
+
+        var = self.analyzer.decls[stmt]
+        if var is None:
+            self.defined.add("g_" + name)
+        elif var.boxed:
+            self.emit(f"{var.py_name} = [None]")
+
+        if stmt.supercls:
+            # the superclass is kept in its own variable, like the scope
+            # holding `super` in the tree-walker
+            super_var = self.analyzer.supers[stmt]
+            if super_var.boxed:
+                self.emit(f"{super_var.py_name} = [{supercls}]")
+                supercls = f"{super_var.py_name}[0]"
+            else:
+                self.emit(f"{super_var.py_name} = {supercls}")
+                supercls = super_var.py_name
+
+        methods = []
+        for method in stmt.methods:
+            self.analyzer.counter += 1
+            attribute = attribute_name(method.name.lexeme)
+            py_name = f"_m{self.analyzer.counter}_{attribute}"
+            init = method.name.lexeme == "init"
+            self.emit_function(method, py_name, True, init)
+            methods.append(f"{attribute!r}: {py_name}")
+
+        value = f"_make_class({name!r}, {supercls}, {{{', '.join(methods)}}})"
+        if var is not None and var.boxed:
+            self.emit(f"{var.py_name}[0] = {value}")
+        else:
+            self.define(stmt, name, value)
+
+    def visit_return_statement(self, stmt):
+        if self.init:
+            self.emit("return this")
+        elif stmt.expr:
+            self.emit(f"return {stmt.expr.accept(self)}")
+        else:
+            self.emit("return None")
+
+    # expressions
+    def visit_literal_expr(self, expr):
+        return literal(expr.value)
+
+    def visit_grouping_expr(self, expr):
+        return expr.expr.accept(self)
+
+    def visit_unary_expr(self, expr):
+        op = expr.op
+        if op.type == TokenType.BANG:
+            if is_boolean(expr.right):
+                return f"(not {expr.right.accept(self)})"
+            t = self.temp()
+            return f"(({t} := {expr.right.accept(self)}) is None or {t} is False)"
+
+        if isinstance(expr.right, LiteralExpr) and type(expr.right.value) is float:
+            return f"(-{literal(expr.right.value)})"
+        t = self.temp()
+        return (
+            f"(-{t} if type({t} := {expr.right.accept(self)}) is _float "
+            f"else _fail({op.line}, 'Operand must be a number.'))"
+        )
+
+    def visit_binary_expr(self, expr):
+        op = expr.op
+        if op.type == TokenType.EQUAL_EQUAL:
+            return f"({expr.left.accept(self)} == {expr.right.accept(self)})"
+        if op.type == TokenType.BANG_EQUAL:
+            return f"({expr.left.accept(self)} != {expr.right.accept(self)})"
+
+        left, right = self.temp(), self.temp()
+        left_value = expr.left.accept(self)
+        right_value = expr.right.accept(self)
+        if op.type == TokenType.PLUS:
+            return (
+                f"({left} + {right} if type({left} := {left_value}) is "
+                f"type({right} := {right_value}) in _addable else _fail({op.line}, "
+                f"'Operands must be two numbers or two strings.'))"
+            )
+        if op.type == TokenType.SLASH:
+            return (
+                f"({left} / {right} if type({left} := {left_value}) is "
+                f"type({right} := {right_value}) is _float and {right} else "
+                f"_divide_error({left}, {right}, {op.line}))"
+            )
+
+        error = f"_fail({op.line}, 'Operands must be numbers.')"
+        symbol = NUMERIC_OPS[op.type]
+        if isinstance(expr.right, LiteralExpr) and type(expr.right.value) is float:
+            # the common `n - 1` / `i < 10` shape only checks one operand
+            return (
+                f"({left} {symbol} {right_value} if type({left} := {left_value}) "
+                f"is _float else {error})"
+            )
+        return (
+            f"({left} {symbol} {right} if type({left} := {left_value}) is "
+            f"type({right} := {right_value}) is _float else {error})"
+        )
+
+    def visit_logical_expr(self, expr):
+        right = expr.right.accept(self)
+        if is_boolean(expr.left):
+            op = "or" if expr.op.type == TokenType.OR else "and"
+            return f"({expr.left.accept(self)} {op} {right})"
+
+        t = self.temp()
+        test = f"({t} := {expr.left.accept(self)}) is not None and {t} is not False"
+        if expr.op.type == TokenType.OR:
+            return f"({t} if {test} else {right})"
+        return f"({right} if {test} else {t})"
+
+    def visit_variable_expr(self, expr):
+        return self.read(expr, expr.name.lexeme, expr.name.line)
+
+    def visit_assign_expr(self, expr):
+        name = expr.name
+        return self.write(expr, name.lexeme, expr.expr.accept(self), name.line)
+
+    def visit_call_expr(self, expr):
+        t = self.temp()
+        if isinstance(expr.callee, GetExpr):
+            callee = self.get_property(expr.callee)
+        elif isinstance(expr.callee, SuperExpr):
+            callee = self.super_method(expr.callee)
+        else:
+            callee = expr.callee.accept(self)
+        args = ", ".join(arg.accept(self) for arg in expr.args)
+        line = expr.paren.line
+        site = f"{CALL_SITE}{line}{CALL_SITE}"
+        return (
+            f"({site}{t}({args}) if getattr({t} := {callee}, '__lox_arity__', None) "
+            f"== {len(expr.args)} else {site}_call({t}, {line}"
+            f"{', ' if args else ''}{args}))"
+        )
+
+    def visit_get_expr(self, expr):
+        t = self.temp()
+        return (
+            f"(_bind({t}) if type({t} := {self.get_property(expr)}) is _method "
+            f"else {t})"
+        )
+
+    def get_property(self, expr):
+        obj, value = self.temp(), self.temp()
+        name = expr.name
+        attribute = attribute_name(name.lexeme)
+        return (
+            f"({value} if isinstance({obj} := {expr.obj.accept(self)}, _instance) "
+            f"and ({value} := getattr({obj}, {attribute!r}, _missing)) is not "
+            f"_missing else _get_error({obj}, {name.lexeme!r}, {name.line}))"
+        )
+
+    def visit_set_expr(self, expr):
+        name = expr.name
+        return (
+            f"_set_attribute({expr.obj.accept(self)}, "
+            f"{attribute_name(name.lexeme)!r}, {expr.value.accept(self)}, {name.line})"
+        )
+
+    def visit_this_expr(self, expr):
+        return self.read(expr, "this", expr.keyword.line)
+
+    def visit_super_expr(self, expr):
+        return f"_bind({self.super_method(expr)})"
+
+    def super_method(self, expr):
+        supercls = self.read(expr, "super", expr.keyword.line)
+        this = self.read(expr.keyword, "this", expr.keyword.line)
+        method = expr.method
+        return f"_super_method({supercls}, {this}, {method.lexeme!r}, {method.line})"
+
+
+class PythonInterpreter:
+    """
+    Runs programs by transpiling them to python. Globals live in one namespace
+    for the lifetime of the interpreter, so the REPL sees earlier definitions.
+    """
+
+    def __init__(self):
+        self.namespace = make_namespace()
+        self.chunks = 0
+        # room for the front end only: the transpiler, python's compiler and
+        # the transpiled code run under python's own limit, as the last two
+        # recurse on the C stack
+        make_room(DEFAULT_MAX_DEPTH)
+
+    def resolve(self, expr, depth, slot):
+        # the transpiler tracks scopes itself
+        pass
+
+    def compile(self, statements, filename="<lox>"):
+        # returns None if the program nests deeper than python can compile
+        defined = {name for name in self.namespace if name.startswith("g_")}
+        try:
+            with c_stack_limit():
+                source = Transpiler(defined).transpile(statements)
+                return compile(source, filename, "exec")
+        except (RecursionError, SyntaxError):
+            Lox.nesting_error(statements)
+            return None
+
+    def run(self, code):
+        try:
+            with c_stack_limit():
+                exec(code, self.namespace)
+        except RunTimeError as ex:
+            Lox.runtime_error(ex)
+        except RecursionError as ex:
+            Lox.runtime_error(runtime_error(self.error_line(ex), "Stack overflow."))
+
+    def error_line(self, error):
+        # the Lox line of the innermost generated code the error came through
+        tables = self.namespace["_lox_lines"]
+        line = 0
+        tb = error.__traceback__
+        while tb is not None:
+            table = tables.get(tb.tb_frame.f_code.co_filename)
+            if table is not None and tb.tb_lineno <= len(table):
+                line = table[tb.tb_lineno - 1]
+            tb = tb.tb_next
+        return line
+
+    def interpret(self, statements):
+        # each chunk of the REPL has a file name, and line table, of its own
+        self.chunks += 1
+        code = self.compile(statements, f"<lox {self.chunks}>")
+        if code is not None:
+            self.run(code)
+
+
+class CodeCache:
+    """
+    Keeps the code objects of transpiled scripts in a __loxcache__ directory
+    next to the script. An entry is only used if it was made from the same
+    source, with the same options, by the same transpiler and python version.
+    """
+
+    def __init__(self, script, optimize=True):
+        directory, name = os.path.split(os.path.abspath(script))
+        self.path = os.path.join(directory, CACHE_DIR, name + "c")
+        self.optimize = optimize
+
+    def key(self, source):
+        digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+        digest.update(bytes([VERSION, self.optimize]))
+        digest.update(source.encode())
+        return digest.digest()
+
+    def load(self, source):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        key = self.key(source)
+        if not data.startswith(key):
+            return None
+        try:
+            return marshal.loads(data[len(key) :])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def store(self, source, code):
+        # a cache we can't write is not an error, the script just won't be cached
+        tmp = f"{self.path}.{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(self.key(source) + marshal.dumps(code))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
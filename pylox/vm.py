@@ -0,0 +1,486 @@
+import time
+
+from lox import Lox
+from chunk import *
+from compiler import Compiler
+from tokens import Token, TokenType
+from interpreter import DEFAULT_MAX_DEPTH, RunTimeError, make_room, stringify
+
+
+class ObjNative:
+    __slots__ = ("name", "arity", "fn")
+
+    def __init__(self, name, arity, fn):
+        self.name = name
+        self.arity = arity
+        self.fn = fn
+
+    def __str__(self):
+        return "<native fn>"
+
+
+class ObjClosure:
+    __slots__ = ("function", "upvalues")
+
+    def __init__(self, function, upvalues):
+        self.function = function
+        self.upvalues = upvalues
+
+    def __str__(self):
+        return str(self.function)
+
+
+class ObjUpvalue:
+    __slots__ = ("location", "closed")
+
+    def __init__(self, location):
+        self.location = location  # stack index while open, -1 once closed
+        self.closed = None
+
+
+class ObjClass:
+    __slots__ = ("name", "methods")
+
+    def __init__(self, name):
+        self.name = name
+        self.methods = {}
+
+    def __str__(self):
+        return self.name
+
+
+class ObjInstance:
+    __slots__ = ("cls", "fields")
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.fields = {}
+
+    def __str__(self):
+        return f"{self.cls.name} instance"
+
+
+class ObjBoundMethod:
+    __slots__ = ("receiver", "method")
+
+    def __init__(self, receiver, method):
+        self.receiver = receiver
+        self.method = method
+
+    def __str__(self):
+        return str(self.method)
+
+
+class CallFrame:
+    __slots__ = ("closure", "ip", "base")
+
+    def __init__(self, closure, base):
+        self.closure = closure
+        self.ip = 0
+        self.base = base  # stack index of slot zero
+
+
+class VM:
+    def __init__(self, max_depth=None):
+        self.globals = {"clock": ObjNative("clock", 0, time.time)}
+        self.stack = []
+        self.frames = []
+        # open ObjUpvalues ordered by stack index, the topmost last, as in
+        # clox: a return only looks at the ones it closes
+        self.open_upvalues = []
+        # frames live in a list, so Lox calls don't recurse in python, but
+        # the front end and the compiler do, as deeply as the program nests
+        self.max_depth = max_depth or DEFAULT_MAX_DEPTH
+        make_room(self.max_depth)
+
+    def resolve(self, expr, depth, slot):
+        # the compiler works out locals and upvalues on its own
+        pass
+
+    def interpret(self, statements):
+        try:
+            function = Compiler().compile(statements)
+        except RecursionError:
+            Lox.nesting_error(statements)
+            return
+
+        closure = ObjClosure(function, [])
+        self.stack = [closure]
+        self.frames = [CallFrame(closure, 0)]
+        self.open_upvalues = []
+        try:
+            self.run()
+        except RunTimeError as ex:
+            Lox.runtime_error(ex)
+
+    def error(self, frame, ip, msg):
+        line = frame.closure.function.chunk.lines[ip - 1]
+        return RunTimeError(Token(TokenType.EOF, "", None, line), msg)
+
+    def capture_upvalue(self, location):
+        open_upvalues = self.open_upvalues
+        idx = len(open_upvalues)
+        while idx and open_upvalues[idx - 1].location > location:
+            idx -= 1
+        if idx and open_upvalues[idx - 1].location == location:
+            return open_upvalues[idx - 1]
+
+        upvalue = ObjUpvalue(location)
+        open_upvalues.insert(idx, upvalue)
+        return upvalue
+
+    def close_upvalues(self, last):
+        stack = self.stack
+        open_upvalues = self.open_upvalues
+        while open_upvalues and open_upvalues[-1].location >= last:
+            upvalue = open_upvalues.pop()
+            upvalue.closed = stack[upvalue.location]
+            upvalue.location = -1
+
+    def call_value(self, callee, argc, frame, ip):
+        """
+        Calls anything but a plain closure, which the dispatch loop handles
+        inline. Returns the closure to push a frame for, or None if the call
+        has already completed and left its result on the stack.
+        """
+        stack = self.stack
+        if type(callee) is ObjBoundMethod:
+            stack[-1 - argc] = callee.receiver
+            callee = callee.method
+        elif type(callee) is ObjClass:
+            stack[-1 - argc] = ObjInstance(callee)
+            init = callee.methods.get("init")
+            if init is None:
+                if argc != 0:
+                    raise self.error(
+                        frame, ip, f"Expected 0 arguments, {argc} provided."
+                    )
+                return None
+            callee = init
+        elif type(callee) is ObjNative:
+            if argc != callee.arity:
+                raise self.error(
+                    frame, ip, f"Expected {callee.arity} arguments, {argc} provided."
+                )
+            result = callee.fn(*stack[len(stack) - argc :])
+            del stack[len(stack) - argc - 1 :]
+            stack.append(result)
+            return None
+        elif type(callee) is not ObjClosure:
+            raise self.error(frame, ip, "can only call functions.")
+
+        if argc != callee.function.arity:
+            raise self.error(
+                frame,
+                ip,
+                f"Expected {callee.function.arity} arguments, {argc} provided.",
+            )
+        return callee
+
+    def run(self):
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        globals = self.globals
+        max_depth = self.max_depth  # the script itself takes the first frame
+
+        frame = frames[-1]
+        chunk = frame.closure.function.chunk
+        code = chunk.code
+        constants = chunk.constants
+        upvalues = frame.closure.upvalues
+        base = frame.base
+        ip = frame.ip
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            # roughly ordered by how often the instructions run
+            if op == OP_GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op == OP_CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+            elif op == OP_POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip += code[ip]
+                ip += 1
+            elif op == OP_SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == OP_POP:
+                pop()
+            elif op == OP_GET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                try:
+                    push(globals[name])
+                except KeyError:
+                    raise self.error(frame, ip, f"Undefined variable '{name}'.")
+            elif op == OP_ADD:
+                right = pop()
+                left = stack[-1]
+                if (type(left) is float and type(right) is float) or (
+                    type(left) is str and type(right) is str
+                ):
+                    stack[-1] = left + right
+                else:
+                    raise self.error(
+                        frame, ip, "Operands must be two numbers or two strings."
+                    )
+            elif op == OP_SUBTRACT:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = left - right
+            elif op == OP_LESS:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = left < right
+            elif op == OP_LOOP:
+                ip = ip + 1 - code[ip]
+            elif op == OP_GET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                if upvalue.location >= 0:
+                    push(stack[upvalue.location])
+                else:
+                    push(upvalue.closed)
+            elif op == OP_CALL:
+                argc = code[ip]
+                ip += 1
+                callee = stack[-1 - argc]
+                if type(callee) is not ObjClosure:
+                    callee = self.call_value(callee, argc, frame, ip)
+                    if callee is None:
+                        continue
+                elif argc != callee.function.arity:
+                    raise self.error(
+                        frame,
+                        ip,
+                        f"Expected {callee.function.arity} arguments, {argc} provided.",
+                    )
+
+                if len(frames) > max_depth:
+                    raise self.error(frame, ip, "Stack overflow.")
+                frame.ip = ip
+                frame = CallFrame(callee, len(stack) - argc - 1)
+                frames.append(frame)
+                chunk = callee.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                upvalues = callee.upvalues
+                base = frame.base
+                ip = 0
+            elif op == OP_RETURN:
+                result = pop()
+                if self.open_upvalues:
+                    self.close_upvalues(base)
+                frames.pop()
+                if not frames:
+                    del stack[:]
+                    return
+
+                del stack[base:]
+                push(result)
+                frame = frames[-1]
+                chunk = frame.closure.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                upvalues = frame.closure.upvalues
+                base = frame.base
+                ip = frame.ip
+            elif op == OP_INVOKE or op == OP_SUPER_INVOKE:
+                name = constants[code[ip]]
+                argc = code[ip + 1]
+                ip += 2
+                if op == OP_SUPER_INVOKE:
+                    method = pop().methods.get(name)
+                else:
+                    receiver = stack[-1 - argc]
+                    if type(receiver) is not ObjInstance:
+                        # ip - 1 is the name, which has the line of the lookup
+                        raise self.error(
+                            frame, ip - 1, "only instances can have properties."
+                        )
+                    method = receiver.fields.get(name, receiver)
+                    if method is not receiver:
+                        # a field shadowing the method is called like any value
+                        stack[-1 - argc] = method
+                        callee = self.call_value(method, argc, frame, ip)
+                        if callee is None:
+                            continue
+                        method = callee
+                    else:
+                        method = receiver.cls.methods.get(name)
+
+                if method is None:
+                    raise self.error(frame, ip - 1, f"Undefined property {name}.")
+                if argc != method.function.arity:
+                    raise self.error(
+                        frame,
+                        ip,
+                        f"Expected {method.function.arity} arguments, {argc} provided.",
+                    )
+
+                if len(frames) > max_depth:
+                    raise self.error(frame, ip, "Stack overflow.")
+                frame.ip = ip
+                frame = CallFrame(method, len(stack) - argc - 1)
+                frames.append(frame)
+                chunk = method.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                upvalues = method.upvalues
+                base = frame.base
+                ip = 0
+            elif op == OP_GET_PROPERTY:
+                name = constants[code[ip]]
+                ip += 1
+                obj = stack[-1]
+                if type(obj) is not ObjInstance:
+                    raise self.error(frame, ip, "only instances can have properties.")
+                if name in obj.fields:
+                    stack[-1] = obj.fields[name]
+                else:
+                    method = obj.cls.methods.get(name)
+                    if method is None:
+                        raise self.error(frame, ip, f"Undefined property {name}.")
+                    stack[-1] = ObjBoundMethod(obj, method)
+            elif op == OP_SET_PROPERTY:
+                value = pop()
+                obj = stack[-1]
+                if type(obj) is not ObjInstance:
+                    raise self.error(
+                        frame, ip + 1, "only instances can set properties."
+                    )
+                obj.fields[constants[code[ip]]] = value
+                ip += 1
+                stack[-1] = value
+            elif op == OP_JUMP_IF_FALSE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip += code[ip]
+                ip += 1
+            elif op == OP_JUMP:
+                ip += code[ip] + 1
+            elif op == OP_NIL:
+                push(None)
+            elif op == OP_TRUE:
+                push(True)
+            elif op == OP_FALSE:
+                push(False)
+            elif op == OP_SET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name not in globals:
+                    raise self.error(frame, ip, f"Undefined variable '{name}'.")
+                globals[name] = stack[-1]
+            elif op == OP_DEFINE_GLOBAL:
+                globals[constants[code[ip]]] = pop()
+                ip += 1
+            elif op == OP_SET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                if upvalue.location >= 0:
+                    stack[upvalue.location] = stack[-1]
+                else:
+                    upvalue.closed = stack[-1]
+            elif op == OP_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == OP_NOT_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == OP_GREATER:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = left > right
+            elif op == OP_GREATER_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = left >= right
+            elif op == OP_LESS_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = left <= right
+            elif op == OP_MULTIPLY:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                stack[-1] = left * right
+            elif op == OP_DIVIDE:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise self.error(frame, ip, "Operands must be numbers.")
+                if right == 0:
+                    raise self.error(frame, ip, "Division by zero.")
+                stack[-1] = left / right
+            elif op == OP_NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == OP_NEGATE:
+                value = stack[-1]
+                if type(value) is not float:
+                    raise self.error(frame, ip, "Operand must be a number.")
+                stack[-1] = -value
+            elif op == OP_PRINT:
+                print(stringify(pop()))
+            elif op == OP_ASSERT:
+                value = pop()
+                if value is None or value is False:
+                    raise self.error(frame, ip, "Assert Failed.")
+            elif op == OP_CLOSURE:
+                function = constants[code[ip]]
+                ip += 1
+                captured = []
+                for _ in range(function.upvalue_count):
+                    is_local = code[ip]
+                    index = code[ip + 1]
+                    ip += 2
+                    if is_local:
+                        captured.append(self.capture_upvalue(base + index))
+                    else:
+                        captured.append(upvalues[index])
+                push(ObjClosure(function, captured))
+            elif op == OP_CLOSE_UPVALUE:
+                self.close_upvalues(len(stack) - 1)
+                pop()
+            elif op == OP_GET_SUPER:
+                name = constants[code[ip]]
+                ip += 1
+                supercls = pop()
+                method = supercls.methods.get(name)
+                if method is None:
+                    raise self.error(frame, ip, f"Undefined property {name}.")
+                stack[-1] = ObjBoundMethod(stack[-1], method)
+            elif op == OP_CLASS:
+                push(ObjClass(constants[code[ip]]))
+                ip += 1
+            elif op == OP_INHERIT:
+                supercls = stack[-2]
+                if type(supercls) is not ObjClass:
+                    raise self.error(frame, ip, "superclass must be a class.")
+                # classes can't change once declared, so copying down is safe
+                pop().methods.update(supercls.methods)
+            elif op == OP_METHOD:
+                method = pop()
+                stack[-1].methods[constants[code[ip]]] = method
+                ip += 1
+            else:
+                raise RuntimeError(f"unknown opcode {op}")